@@ -16,8 +16,25 @@ from app.core.auth import (
     get_current_admin,
 )
 from app.services.captcha import captcha_service
-from app.core.redis import get_redis, CacheManager
+from app.core.redis import (
+    get_redis,
+    CacheManager,
+    SemanticCache,
+    local_cache,
+    cache_generations,
+    hot_queries,
+    CACHE_FAMILIES,
+)
 from app.services.cost_monitor import cost_monitor
+from app.services.rerank import rerank_service
+from app.services.llm import llm_service
+from app.services.retrieval import (
+    RetrievalService,
+    RetrievalOptions,
+    get_retrieval_options,
+    set_retrieval_options,
+)
+from app.services.vector_index import vector_index
 
 settings = get_settings()
 router = APIRouter(prefix="/api/admin", tags=["admin"])
@@ -229,6 +246,52 @@ async def get_full_dashboard(admin: dict = Depends(get_current_admin)):
     return full_data
 
 
+@router.get("/rerank/shadow")
+async def get_rerank_shadow_stats(
+    days: int = 7,
+    admin: dict = Depends(get_current_admin)
+):
+    """Get agreement between local and remote rerank (shadow mode)"""
+    return await rerank_service.get_shadow_agreement(days)
+
+
+# ==================== Retrieval Tuning ====================
+
+@router.get("/retrieval")
+async def get_retrieval_settings(admin: dict = Depends(get_current_admin)):
+    """Get active retrieval options and the vector search query plan"""
+    from app.core.database import async_session_maker
+    
+    options = await get_retrieval_options()
+    async with async_session_maker() as session:
+        explain = await RetrievalService(session).explain(options)
+    
+    return {
+        "options": options.model_dump(),
+        "defaults": RetrievalOptions.from_settings().model_dump(),
+        "backend": "in_process" if vector_index.ready else "pgvector",
+        "retrieval_mode": settings.RETRIEVAL_MODE,
+        **explain,
+    }
+
+
+@router.put("/retrieval")
+async def update_retrieval_settings(
+    options: RetrievalOptions,
+    admin: dict = Depends(get_current_admin)
+):
+    """Override retrieval options at runtime (all workers pick it up within seconds)"""
+    await set_retrieval_options(options)
+    return {"success": True, "options": options.model_dump()}
+
+
+@router.delete("/retrieval")
+async def reset_retrieval_settings(admin: dict = Depends(get_current_admin)):
+    """Drop the runtime override and return to configured defaults"""
+    await set_retrieval_options(None)
+    return {"success": True, "options": RetrievalOptions.from_settings().model_dump()}
+
+
 # ==================== Cache Management ====================
 
 @router.post("/cache/clear")
@@ -240,33 +303,57 @@ async def clear_cache(
     Clear cache
     
     Args:
-        cache_type: Optional type to clear (answers, docs, embeddings, all)
+        cache_type: Optional type to clear (answers, docs, embeddings, semantic, rerank, suggestions, all)
     """
     redis_client = await get_redis()
     
     if cache_type == "all" or cache_type is None:
-        await redis_client.flushdb()
+        await cache_generations.bump(redis_client)
         return {"success": True, "message": "All cache cleared"}
     
     # Clear specific type
-    pattern_map = {
-        "answers": "chat:answer:*",
-        "docs": "chat:docs:*",
-        "embeddings": "embedding:*",
-    }
-    
-    pattern = pattern_map.get(cache_type)
-    if not pattern:
+    if cache_type not in CACHE_FAMILIES:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail=f"Invalid cache type: {cache_type}",
         )
     
-    keys = await redis_client.keys(pattern)
-    if keys:
-        await redis_client.delete(*keys)
+    # Old keys are no longer read and are removed by the background sweeper
+    gens = await cache_generations.bump(redis_client, cache_type)
     
     return {
         "success": True, 
-        "message": f"Cleared {len(keys)} keys matching {cache_type}"
+        "message": f"Cleared {cache_type} (now generation {gens[cache_type]})"
     }
+
+
+@router.get("/llm/endpoints")
+async def get_llm_endpoint_stats(admin: dict = Depends(get_current_admin)):
+    """Get per-endpoint time-to-first-token stats for this worker"""
+    return llm_service.get_endpoint_stats()
+
+
+@router.get("/queries/hot")
+async def get_hot_queries(
+    limit: int = 20,
+    admin: dict = Depends(get_current_admin)
+):
+    """Get the most frequent recent queries with their cache hit ratio"""
+    limit = min(max(limit, 1), 200)
+    return {
+        "distinct_queries": await hot_queries.distinct_count(),
+        "queries": await hot_queries.top(limit),
+    }
+
+
+@router.get("/cache/stats")
+async def get_cache_tier_stats(admin: dict = Depends(get_current_admin)):
+    """Get L0 (in-process) vs Redis hit/miss counts for this worker"""
+    return local_cache.get_stats()
+
+
+@router.get("/cache/semantic/stats")
+async def get_semantic_cache_stats(admin: dict = Depends(get_current_admin)):
+    """Get semantic answer cache hit/miss statistics"""
+    redis_client = await get_redis()
+    return await SemanticCache(redis_client).get_stats()
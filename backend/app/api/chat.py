@@ -1,7 +1,7 @@
 """
 Chat API endpoints
 """
-from typing import List, Optional
+from typing import AsyncGenerator, List, Optional
 from fastapi import APIRouter, Depends, HTTPException
 from fastapi.responses import StreamingResponse
 from pydantic import BaseModel, Field
@@ -10,12 +10,16 @@ import hashlib
 import logging
 
 from app.core.database import get_db
-from app.core.redis import get_redis, CacheManager
+from app.core.config import get_settings, DEFAULT_SUGGESTIONS
+from app.core.redis import get_redis, CacheManager, SemanticCache, hot_queries
 from app.core.security import check_prompt_injection, sanitize_input
-from app.services.retrieval import RetrievalService
+from app.core.sse import SSEEncoder
+from app.services.embedding import embedding_service
+from app.services.retrieval import RetrievalService, is_keyword_query
 from app.services.rerank import rerank_service
 from app.services.llm import llm_service
 
+settings = get_settings()
 logger = logging.getLogger(__name__)
 router = APIRouter(prefix="/api", tags=["chat"])
 
@@ -39,6 +43,19 @@ class ChatResponse(BaseModel):
     sources: List[dict] = []
 
 
+def _sse_response(stream: AsyncGenerator[str, None]) -> StreamingResponse:
+    """Wrap an SSE generator in a non-buffered streaming response"""
+    return StreamingResponse(
+        stream,
+        media_type="text/event-stream",
+        headers={
+            "Cache-Control": "no-cache",
+            "Connection": "keep-alive",
+            "X-Accel-Buffering": "no",
+        }
+    )
+
+
 @router.post("/chat")
 async def chat(
     request: ChatRequest,
@@ -73,13 +90,41 @@ async def chat(
     cache = CacheManager(redis_client)
     
     cached_answer = await cache.get_answer(query, history_hash)
-    if cached_answer and not request.stream:
+    
+    # Semantic cache: reuse answers to paraphrased questions (first turn only).
+    # Exact-term keyword queries skip it so hybrid retrieval needs no embedding.
+    semantic_cache = None
+    query_embedding = None
+    if (
+        not cached_answer
+        and not history
+        and settings.SEMANTIC_CACHE_ENABLED
+        and not is_keyword_query(query)
+    ):
+        semantic_cache = SemanticCache(redis_client)
+        query_embedding = await embedding_service.embed_text(query)
+        match = await semantic_cache.lookup(query_embedding)
+        if match:
+            logger.info(
+                f"Semantic cache hit {match['id']} ({match['similarity']:.3f}) for: {query[:50]}..."
+            )
+            cached_answer = match["answer"]
+    
+    # First-turn questions feed the cache warmer (buffered, no Redis I/O here)
+    if not history:
+        hot_queries.record(query, cache_hit=bool(cached_answer))
+    
+    if cached_answer:
         logger.info(f"Answer cache hit for: {query[:50]}...")
+        if request.stream:
+            return _sse_response(SSEEncoder().replay(cached_answer))
         return ChatResponse(response=cached_answer, sources=[])
     
     # Retrieve relevant documents
     retrieval_service = RetrievalService(db)
-    docs = await retrieval_service.search_with_empty_fallback(query, top_k=10)
+    docs = await retrieval_service.search_with_empty_fallback(
+        query, query_embedding=query_embedding
+    )
     
     # Skip rerank if fallback or only one doc
     if len(docs) > 1 and docs[0].get("source_type") != "fallback":
@@ -91,32 +136,43 @@ async def chat(
         # Streaming response
         async def generate():
             full_response = []
-            async for chunk in llm_service.generate_stream(query, docs, history):
-                full_response.append(chunk)
-                yield f"data: {chunk}\n\n"
-            yield "data: [DONE]\n\n"
+            failed = False
             
-            # Cache the complete response
+            async def deltas():
+                nonlocal failed
+                try:
+                    async for chunk in llm_service.generate_stream(query, docs, history, fallback=False):
+                        full_response.append(chunk)
+                        yield chunk
+                except Exception:
+                    failed = True
+                    yield await llm_service.fallback_response(docs)
+            
+            async for event in SSEEncoder().encode(deltas()):
+                yield event
+            
+            # Cache the complete response (never the outage fallback)
             complete = "".join(full_response)
-            if complete and len(complete) > 10:
+            if not failed and complete and len(complete) > 10:
                 await cache.set_answer(query, complete, history_hash)
+                if semantic_cache:
+                    await semantic_cache.add(query, query_embedding, complete)
         
-        return StreamingResponse(
-            generate(),
-            media_type="text/event-stream",
-            headers={
-                "Cache-Control": "no-cache",
-                "Connection": "keep-alive",
-                "X-Accel-Buffering": "no",
-            }
-        )
+        return _sse_response(generate())
     else:
         # Non-streaming response
-        response = await llm_service.generate(query, docs, history)
+        failed = False
+        try:
+            response = await llm_service.generate(query, docs, history, fallback=False)
+        except Exception:
+            failed = True
+            response = await llm_service.fallback_response(docs)
         
-        # Cache response
-        if response and len(response) > 10:
+        # Cache response (never the outage fallback)
+        if not failed and response and len(response) > 10:
             await cache.set_answer(query, response, history_hash)
+            if semantic_cache:
+                await semantic_cache.add(query, query_embedding, response)
         
         return ChatResponse(
             response=response,
@@ -128,23 +184,14 @@ async def chat(
 async def get_suggestions():
     """Get suggested questions"""
     redis_client = await get_redis()
+    cache = CacheManager(redis_client)
     
     # Try cache first
-    cached = await redis_client.get("suggestions")
+    cached = await cache.get_suggestions()
     if cached:
-        import json
-        return {"suggestions": json.loads(cached)}
-    
-    # Default suggestions
-    suggestions = [
-        "你的主要技术栈是什么？",
-        "介绍一下你做过的项目",
-        "你有什么工作经验？",
-        "如何联系你？",
-    ]
+        return {"suggestions": cached}
     
     # Cache for 5 minutes
-    import json
-    await redis_client.setex("suggestions", 300, json.dumps(suggestions))
+    await cache.set_suggestions(DEFAULT_SUGGESTIONS, ttl=300)
     
-    return {"suggestions": suggestions}
+    return {"suggestions": DEFAULT_SUGGESTIONS}
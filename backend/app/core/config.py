@@ -22,6 +22,33 @@ class Settings(BaseSettings):
     # GitHub
     GITHUB_TOKEN: str = ""
     
+    # Upstream HTTP clients
+    HTTP_MAX_CONNECTIONS: int = 100
+    HTTP_MAX_KEEPALIVE_CONNECTIONS: int = 20
+    HTTP_KEEPALIVE_EXPIRY: float = 60.0
+    HTTP2_ENABLED: bool = True
+    HTTP_CONNECT_TIMEOUT: float = 5.0
+    EMBEDDING_TIMEOUT: float = 30.0
+    RERANK_TIMEOUT: float = 10.0
+    LLM_TIMEOUT: float = 60.0
+    
+    # LLM endpoints as a JSON list of {"name", "api_base", "api_key", "model"};
+    # empty uses LLM_API_BASE / LLM_API_KEY. A request is hedged on the next
+    # endpoint when no token arrives within LLM_FIRST_TOKEN_DEADLINE seconds (0 = off).
+    LLM_ENDPOINTS: str = ""
+    LLM_FIRST_TOKEN_DEADLINE: float = 3.0
+    
+    # Rerank mode: remote | fallback (local on API failure) | primary (local only)
+    # | shadow (remote, compared against local)
+    RERANK_MODE: str = "fallback"
+    
+    # Embedding micro-batching (DashScope accepts up to 10 texts per call)
+    EMBEDDING_BATCH_WINDOW_MS: float = 8.0
+    EMBEDDING_BATCH_MAX_SIZE: int = 10
+    
+    # Single-flight coalescing (cross-worker lock lifetime)
+    SINGLEFLIGHT_LOCK_TTL_MS: int = 15000
+    
     # Admin
     ADMIN_USERNAME: str = "admin"
     ADMIN_PASSWORD_HASH: str = ""
@@ -35,6 +62,58 @@ class Settings(BaseSettings):
     DAILY_LLM_TOKEN_LIMIT: int = 100000
     MONTHLY_BUDGET_CNY: float = 50.0
     
+    # Retrieval
+    VECTOR_INDEX_ENABLED: bool = False
+    VECTOR_INDEX_REFRESH_SECONDS: int = 60
+    RETRIEVAL_MODE: str = "vector"  # vector | hybrid (vector + lexical, RRF)
+    RETRIEVAL_TOP_K: int = 10
+    RETRIEVAL_THRESHOLD: float = 0.5
+    # Re-run empty HNSW searches as a sequential scan; costs a full table scan
+    # for every out-of-domain query, so only worth it when recall is suspect
+    RETRIEVAL_EXACT_FALLBACK: bool = False
+    HNSW_EF_SEARCH: int = 40
+    HNSW_ITERATIVE_SCAN: str = "off"  # off | relaxed_order | strict_order (pgvector >= 0.8)
+    # Index used for candidate search: full (vector) | halfvec | binary,
+    # must match the index built by init-db.sql / migrations/002_vector_storage_mode.sql
+    VECTOR_STORAGE_MODE: str = "full"
+    RETRIEVAL_RESCORE_CANDIDATES: int = 40
+    RETRIEVAL_RRF_K: int = 60
+    RETRIEVAL_LEXICAL_MIN_COVERAGE: float = 0.5
+    RETRIEVAL_KEYWORD_MAX_TOKENS: int = 6
+    
+    # Estimated input tokens per LLM request (system prompt + documents + history)
+    LLM_INPUT_TOKEN_BUDGET: int = 3000
+    
+    # Chat SSE stream: merge LLM deltas for up to this long / this many characters
+    SSE_COALESCE_MS: float = 20.0
+    SSE_MAX_CHUNK_CHARS: int = 256
+    
+    # In-process L0 cache in front of Redis
+    L0_CACHE_ENABLED: bool = True
+    L0_CACHE_MAX_BYTES: int = 32 * 1024 * 1024
+    L0_CACHE_TTL: int = 300
+    
+    # Metric increments are buffered in-process and written on this interval
+    METRICS_FLUSH_INTERVAL_MS: int = 500
+    
+    # Background removal of keys from superseded cache generations
+    CACHE_SWEEP_INTERVAL_SECONDS: int = 600
+    
+    # Hot-query tracking: decayed counts halve every HOT_QUERY_HALF_LIFE_HOURS
+    HOT_QUERY_MAX_TRACKED: int = 1000
+    HOT_QUERY_HALF_LIFE_HOURS: float = 24
+    
+    # Cache warming: suggestions + most frequent queries, refreshed before answers expire
+    CACHE_WARM_ENABLED: bool = True
+    CACHE_WARM_INTERVAL_HOURS: float = 6
+    CACHE_WARM_TOP_N: int = 20
+    CACHE_WARM_CONCURRENCY: int = 2
+    
+    # Semantic answer cache
+    SEMANTIC_CACHE_ENABLED: bool = True
+    SEMANTIC_CACHE_THRESHOLD: float = 0.92
+    SEMANTIC_CACHE_MAX_ENTRIES: int = 500
+    
     # Application
     DEBUG: bool = False
     LOG_LEVEL: str = "INFO"
@@ -49,3 +128,13 @@ class Settings(BaseSettings):
 def get_settings() -> Settings:
     """Get cached settings instance"""
     return Settings()
+
+
+# Default suggested questions, served by /api/suggestions and
+# pre-answered by the cache warmer
+DEFAULT_SUGGESTIONS = [
+    "你的主要技术栈是什么？",
+    "介绍一下你做过的项目",
+    "你有什么工作经验？",
+    "如何联系你？",
+]
@@ -1,12 +1,20 @@
 """
 Database connection and session management
 """
+import logging
+
+import numpy as np
+from pgvector import Vector as PgVector
+from pgvector.asyncpg import register_vector
+from pgvector.sqlalchemy import Vector
+from sqlalchemy import event
 from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine, async_sessionmaker
 from sqlalchemy.orm import DeclarativeBase
 
 from app.core.config import get_settings
 
 settings = get_settings()
+logger = logging.getLogger(__name__)
 
 # Create async engine
 engine = create_async_engine(
@@ -17,6 +25,34 @@ engine = create_async_engine(
     pool_pre_ping=True,
 )
 
+@event.listens_for(engine.sync_engine, "connect")
+def register_vector_codec(dbapi_connection, connection_record):
+    """Send and receive pgvector values in binary float32 format"""
+    try:
+        dbapi_connection.run_async(register_vector)
+    except ValueError as e:
+        # vector extension not created yet (fresh database)
+        logger.warning(f"pgvector codec not registered: {e}")
+
+
+class BinaryVector(Vector):
+    """
+    `vector` column type for connections using the binary codec above
+
+    pgvector's SQLAlchemy type binds values as text, which the binary codec
+    cannot encode. This binds a `pgvector.Vector` instead so ORM inserts,
+    updates and comparisons go through the codec like raw queries do.
+    """
+    cache_ok = True
+
+    def bind_processor(self, dialect):
+        def process(value):
+            if value is None or isinstance(value, PgVector):
+                return value
+            return PgVector(np.asarray(value, dtype=np.float32))
+        return process
+
+
 # Session factory
 async_session_maker = async_sessionmaker(
     engine,
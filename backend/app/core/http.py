@@ -0,0 +1,91 @@
+"""
+Shared upstream HTTP clients with keep-alive connection pools
+"""
+from typing import Dict
+import logging
+
+import httpx
+
+from app.core.config import get_settings
+
+settings = get_settings()
+logger = logging.getLogger(__name__)
+
+# Upstream host used by each service; services on the same host share a pool
+SERVICE_UPSTREAMS = {
+    "embedding": "dashscope",
+    "rerank": "dashscope",
+    "llm": "llm",
+}
+
+
+class UpstreamClients:
+    """Application-scoped httpx clients, one connection pool per upstream host"""
+
+    def __init__(self):
+        self._clients: Dict[str, httpx.AsyncClient] = {}
+
+    @staticmethod
+    def _http2_available() -> bool:
+        """HTTP/2 needs the optional h2 package"""
+        if not settings.HTTP2_ENABLED:
+            return False
+        try:
+            import h2  # noqa: F401
+            return True
+        except ImportError:
+            logger.warning("HTTP2_ENABLED is set but h2 is not installed, using HTTP/1.1")
+            return False
+
+    def _build_client(self) -> httpx.AsyncClient:
+        """Create a pooled client using the configured limits"""
+        return httpx.AsyncClient(
+            http2=self._http2_available(),
+            limits=httpx.Limits(
+                max_connections=settings.HTTP_MAX_CONNECTIONS,
+                max_keepalive_connections=settings.HTTP_MAX_KEEPALIVE_CONNECTIONS,
+                keepalive_expiry=settings.HTTP_KEEPALIVE_EXPIRY,
+            ),
+            timeout=httpx.Timeout(
+                settings.LLM_TIMEOUT,
+                connect=settings.HTTP_CONNECT_TIMEOUT,
+            ),
+        )
+
+    def startup(self):
+        """Open one client per upstream host"""
+        for upstream in set(SERVICE_UPSTREAMS.values()):
+            self.get(upstream)
+        logger.info(f"Opened upstream HTTP clients: {sorted(self._clients)}")
+
+    def get(self, upstream: str) -> httpx.AsyncClient:
+        """Get the client for an upstream host, creating it on first use"""
+        client = self._clients.get(upstream)
+        if client is None or client.is_closed:
+            client = self._build_client()
+            self._clients[upstream] = client
+        return client
+
+    def for_service(self, service: str) -> httpx.AsyncClient:
+        """Get the shared client used by a service"""
+        return self.get(SERVICE_UPSTREAMS[service])
+
+    @staticmethod
+    def timeout(service: str) -> httpx.Timeout:
+        """Per-service request timeout"""
+        read_timeout = {
+            "embedding": settings.EMBEDDING_TIMEOUT,
+            "rerank": settings.RERANK_TIMEOUT,
+            "llm": settings.LLM_TIMEOUT,
+        }[service]
+        return httpx.Timeout(read_timeout, connect=settings.HTTP_CONNECT_TIMEOUT)
+
+    async def shutdown(self):
+        """Close all clients and their pooled connections"""
+        clients, self._clients = self._clients, {}
+        for client in clients.values():
+            await client.aclose()
+
+
+# Singleton instance
+http_clients = UpstreamClients()
@@ -1,15 +1,23 @@
 """
 Redis connection and caching utilities
 """
+import asyncio
 import hashlib
 import json
-from typing import Optional, Any
+import logging
+import re
+import struct
+import time
+from collections import OrderedDict, defaultdict
+from typing import Callable, Optional, Any, Dict, List, Tuple
 import redis.asyncio as redis
 import msgpack
+import numpy as np
 
 from app.core.config import get_settings
 
 settings = get_settings()
+logger = logging.getLogger(__name__)
 
 # Redis connection pool
 redis_pool = redis.ConnectionPool.from_url(
@@ -23,6 +31,318 @@ async def get_redis() -> redis.Redis:
     return redis.Redis(connection_pool=redis_pool)
 
 
+# Pub/sub channel for L0 invalidation; the message is a key prefix ("" = everything)
+INVALIDATION_CHANNEL = "cache:invalidate"
+# Pub/sub channel announcing that the embeddings table changed (profile import)
+KNOWLEDGE_CHANNEL = "kb:changed"
+
+# Key prefix of each cache family. Keys embed the family generation after the
+# prefix ("chat:answer:g3:<hash>"); clearing a family bumps its generation.
+CACHE_FAMILIES = {
+    "answers": "chat:answer:",
+    "docs": "chat:docs:",
+    "rerank": "chat:rerank:",
+    "embeddings": "embedding:query:",
+    "semantic": "chat:semantic:",
+    "suggestions": "suggestions:",
+}
+
+
+def _family(key: str) -> str:
+    for family, prefix in CACHE_FAMILIES.items():
+        if key.startswith(prefix):
+            return family
+    return "other"
+
+
+class LocalCache:
+    """
+    In-process L0 tier in front of Redis
+    
+    LRU over raw Redis values with a byte budget. Entries live no longer
+    than the key has left in Redis, capped at L0_CACHE_TTL so entries changed
+    by another worker never live long even if an invalidation message is missed.
+    """
+    
+    def __init__(self, max_bytes: int, max_ttl: int):
+        self.max_bytes = max_bytes
+        self.max_ttl = max_ttl
+        self._entries: "OrderedDict[str, Tuple[float, bytes]]" = OrderedDict()
+        self._bytes = 0
+        self._stats: Dict[str, Dict[str, int]] = defaultdict(
+            lambda: {"l0_hits": 0, "l0_misses": 0, "redis_hits": 0, "redis_misses": 0}
+        )
+    
+    def get(self, key: str) -> Optional[bytes]:
+        """Get a live entry and mark it most recently used"""
+        entry = self._entries.get(key)
+        if entry is not None and entry[0] > time.monotonic():
+            self._entries.move_to_end(key)
+            self._stats[_family(key)]["l0_hits"] += 1
+            return entry[1]
+        if entry is not None:
+            self._remove(key)
+        self._stats[_family(key)]["l0_misses"] += 1
+        return None
+    
+    def set(self, key: str, value: bytes, ttl: float):
+        """Store a value, evicting least recently used entries over budget"""
+        if len(value) > self.max_bytes:
+            return
+        self._remove(key)
+        self._entries[key] = (time.monotonic() + min(ttl, self.max_ttl), value)
+        self._bytes += len(value)
+        while self._bytes > self.max_bytes:
+            oldest = next(iter(self._entries))
+            self._remove(oldest)
+    
+    def _remove(self, key: str):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self._bytes -= len(entry[1])
+    
+    def invalidate(self, prefix: str = ""):
+        """Drop entries whose key starts with prefix (all entries for "")"""
+        if not prefix:
+            self._entries.clear()
+            self._bytes = 0
+            return
+        for key in [k for k in self._entries if k.startswith(prefix)]:
+            self._remove(key)
+    
+    def record_redis(self, key: str, hit: bool):
+        """Count a lookup that fell through to Redis"""
+        self._stats[_family(key)]["redis_hits" if hit else "redis_misses"] += 1
+    
+    def get_stats(self) -> Dict[str, Any]:
+        """Hit/miss counts per family and tier for this worker"""
+        return {
+            "entries": len(self._entries),
+            "bytes": self._bytes,
+            "max_bytes": self.max_bytes,
+            "families": {family: dict(counts) for family, counts in self._stats.items()},
+        }
+
+
+# Singleton L0 tier shared by all CacheManager instances in this process
+local_cache = LocalCache(
+    max_bytes=settings.L0_CACHE_MAX_BYTES,
+    max_ttl=settings.L0_CACHE_TTL,
+)
+
+
+class CacheGenerations:
+    """
+    Per-family generation counters (`cache:gen:{family}`)
+    
+    Clearing a family is a single INCR: new keys use the new generation and
+    old ones are never read again, expiring via TTL or the background sweeper.
+    Workers cache the counters briefly and reload them on invalidation messages.
+    """
+    
+    KEY_PREFIX = "cache:gen:"
+    REFRESH_SECONDS = 5
+    
+    def __init__(self):
+        self._gens: Dict[str, int] = {}
+        self._loaded_at = 0.0
+    
+    def expire(self):
+        """Force a reload on next use"""
+        self._loaded_at = 0.0
+    
+    async def current(self, redis_client: redis.Redis) -> Dict[str, int]:
+        """Generation of every family"""
+        if time.monotonic() - self._loaded_at > self.REFRESH_SECONDS:
+            families = list(CACHE_FAMILIES)
+            values = await redis_client.mget([self.KEY_PREFIX + f for f in families])
+            self._gens = {f: int(v or 0) for f, v in zip(families, values)}
+            self._loaded_at = time.monotonic()
+        return self._gens
+    
+    async def prefix(self, redis_client: redis.Redis, family: str) -> str:
+        """Key prefix for the current generation of a family"""
+        gens = await self.current(redis_client)
+        return f"{CACHE_FAMILIES[family]}g{gens[family]}:"
+    
+    async def bump(self, redis_client: redis.Redis, *families: str) -> Dict[str, int]:
+        """Invalidate families (all when none given) by advancing their generation"""
+        families = families or tuple(CACHE_FAMILIES)
+        pipe = redis_client.pipeline(transaction=False)
+        for family in families:
+            pipe.incr(self.KEY_PREFIX + family)
+        new_gens = dict(zip(families, await pipe.execute()))
+        
+        for family in families:
+            await publish_invalidation(redis_client, CACHE_FAMILIES[family])
+        return new_gens
+
+
+# Singleton instance
+cache_generations = CacheGenerations()
+
+
+async def publish_invalidation(redis_client: redis.Redis, prefix: str = ""):
+    """Tell every worker to drop L0 entries under a key prefix and reload generations"""
+    local_cache.invalidate(prefix)
+    cache_generations.expire()
+    await redis_client.publish(INVALIDATION_CHANNEL, prefix.encode())
+
+
+# Called on knowledge base changes (in-process search indexes register here)
+_knowledge_listeners: List[Callable[[], None]] = []
+
+
+def on_knowledge_change(callback: Callable[[], None]):
+    """Register a synchronous callback for knowledge base changes"""
+    _knowledge_listeners.append(callback)
+
+
+def _notify_knowledge_change():
+    for callback in _knowledge_listeners:
+        try:
+            callback()
+        except Exception as e:
+            logger.warning(f"Knowledge change callback failed: {e}")
+
+
+async def publish_knowledge_change(redis_client: redis.Redis):
+    """
+    Tell every worker the embeddings table changed
+    
+    Publish this before bumping the cache generations it affects, so workers
+    stop serving from stale in-process indexes before they cache anew.
+    """
+    _notify_knowledge_change()
+    await redis_client.publish(KNOWLEDGE_CHANNEL, b"")
+
+
+async def listen_for_invalidations():
+    """Background task: apply invalidation and knowledge change messages from other workers"""
+    knowledge_channel = KNOWLEDGE_CHANNEL.encode()
+    while True:
+        pubsub = None
+        try:
+            redis_client = await get_redis()
+            pubsub = redis_client.pubsub(ignore_subscribe_messages=True)
+            await pubsub.subscribe(INVALIDATION_CHANNEL, KNOWLEDGE_CHANNEL)
+            async for message in pubsub.listen():
+                if message["type"] != "message":
+                    continue
+                if message["channel"] == knowledge_channel:
+                    _notify_knowledge_change()
+                else:
+                    local_cache.invalidate(message["data"].decode())
+                    cache_generations.expire()
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            # Missed messages are bounded by L0_CACHE_TTL; drop everything to be safe
+            logger.warning(f"Cache invalidation listener error, reconnecting: {e}")
+            local_cache.invalidate()
+            cache_generations.expire()
+            _notify_knowledge_change()
+            await asyncio.sleep(1)
+        finally:
+            if pubsub is not None:
+                await pubsub.aclose()
+
+
+# Set once the keys written before cache generations existed have been swept
+LEGACY_SWEPT_KEY = "cache:legacy_swept"
+GENERATION_PATTERN = re.compile(rb"g(\d+):")
+
+
+async def sweep_stale_generations(batch_size: int = 500) -> int:
+    """
+    Scheduled job: UNLINK keys left behind by older cache generations
+    
+    Only keys of a generation below the one stored in Redis are removed, so
+    a bump during the sweep never touches the new generation. The first run
+    also removes unversioned keys from before generations were introduced.
+    SCAN and UNLINK work in small batches so the sweep never blocks Redis.
+    """
+    redis_client = await get_redis()
+    sweep_legacy = await redis_client.set(LEGACY_SWEPT_KEY, 1, nx=True)
+    # Unversioned keys under a family prefix that are not cache entries
+    keep = {SemanticCache.STATS_KEY.encode()}
+    removed = 0
+    for family, prefix in CACHE_FAMILIES.items():
+        # Read the counter itself: the per-process copy may lag a bump
+        current = int(await redis_client.get(CacheGenerations.KEY_PREFIX + family) or 0)
+        start = len(prefix)
+        stale = []
+        match = f"{prefix}*" if sweep_legacy else f"{prefix}g*"
+        async for key in redis_client.scan_iter(match=match, count=batch_size):
+            versioned = GENERATION_PATTERN.match(key, start)
+            if versioned:
+                if int(versioned.group(1)) < current:
+                    stale.append(key)
+            elif sweep_legacy and key not in keep:
+                stale.append(key)
+            if len(stale) >= batch_size:
+                removed += await redis_client.unlink(*stale)
+                stale = []
+                await asyncio.sleep(0)
+        if stale:
+            removed += await redis_client.unlink(*stale)
+    if removed:
+        print(f"✅ Swept {removed} stale cache keys")
+    return removed
+
+
+# L3 embedding format: header (version, dimension, model name) + raw little-endian float32
+EMBEDDING_FORMAT_VERSION = 1
+EMBEDDING_HEADER = struct.Struct("<BHB")  # version, dimension, model name length
+
+# L2 docs format: [version, [[content, source_type, source_id, similarity], ...]]
+DOCS_FORMAT_VERSION = 1
+
+
+def pack_embedding(embedding: Any, model: str = "") -> bytes:
+    """Encode an embedding as header + float32 bytes"""
+    vector = np.asarray(embedding, dtype="<f4")
+    model_bytes = model.encode()
+    header = EMBEDDING_HEADER.pack(EMBEDDING_FORMAT_VERSION, vector.shape[0], len(model_bytes))
+    return header + model_bytes + vector.tobytes()
+
+
+def unpack_embedding(data: bytes, model: str = "") -> Optional[np.ndarray]:
+    """Decode without copying; None for other versions, models or corrupt entries"""
+    if len(data) < EMBEDDING_HEADER.size:
+        return None
+    version, dimension, model_len = EMBEDDING_HEADER.unpack_from(data)
+    if version != EMBEDDING_FORMAT_VERSION:
+        return None
+    
+    offset = EMBEDDING_HEADER.size + model_len
+    if model and data[EMBEDDING_HEADER.size:offset].decode() != model:
+        return None
+    if len(data) != offset + 4 * dimension:
+        return None
+    return np.frombuffer(data, dtype="<f4", count=dimension, offset=offset)
+
+
+def pack_docs(docs: List[Dict[str, Any]]) -> bytes:
+    """Encode retrieval results as compact rows"""
+    rows = [
+        [doc["content"], doc["source_type"], doc["source_id"], round(float(doc["similarity"]), 4)]
+        for doc in docs
+    ]
+    return msgpack.packb([DOCS_FORMAT_VERSION, rows])
+
+
+def unpack_docs(data: bytes) -> Optional[List[Dict[str, Any]]]:
+    """Decode retrieval results; None for entries in another format"""
+    payload = msgpack.unpackb(data)
+    if not isinstance(payload, list) or len(payload) != 2 or payload[0] != DOCS_FORMAT_VERSION:
+        return None
+    return [
+        {"content": content, "source_type": source_type, "source_id": source_id, "similarity": similarity}
+        for content, source_type, source_id, similarity in payload[1]
+    ]
+
+
 class CacheManager:
     """Multi-level cache manager"""
     
@@ -30,6 +350,7 @@ class CacheManager:
     L1_TTL = 86400      # 24 hours - complete answers
     L2_TTL = 3600       # 1 hour - retrieval results
     L3_TTL = 604800     # 7 days - query embeddings
+    RERANK_TTL = 3600   # 1 hour - rerank results
     
     def __init__(self, redis_client: redis.Redis):
         self.redis = redis_client
@@ -39,42 +360,453 @@ class CacheManager:
         """Generate MD5 hash for cache key"""
         return hashlib.md5(content.encode()).hexdigest()
     
+    async def _key(self, family: str, suffix: str) -> str:
+        """Key in the current generation of a cache family"""
+        return await cache_generations.prefix(self.redis, family) + suffix
+    
+    async def _get(self, key: str) -> Optional[bytes]:
+        """Read through L0, then Redis"""
+        use_l0 = settings.L0_CACHE_ENABLED
+        if use_l0:
+            data = local_cache.get(key)
+            if data is not None:
+                return data
+        
+        if not use_l0:
+            data = await self.redis.get(key)
+            local_cache.record_redis(key, data is not None)
+            return data
+        
+        pipe = self.redis.pipeline(transaction=False)
+        pipe.get(key)
+        pipe.pttl(key)
+        data, pttl = await pipe.execute()
+        local_cache.record_redis(key, data is not None)
+        self._fill_l0(key, data, pttl)
+        return data
+    
+    @staticmethod
+    def _fill_l0(key: str, data: Optional[bytes], pttl: int):
+        """Keep a Redis value in L0 no longer than it has left in Redis"""
+        if data is None or pttl == -2:
+            return
+        ttl = settings.L0_CACHE_TTL if pttl < 0 else min(pttl / 1000, settings.L0_CACHE_TTL)
+        if ttl > 0:
+            local_cache.set(key, data, ttl)
+    
+    async def _set(self, key: str, ttl: int, data: bytes):
+        """Write to Redis and L0"""
+        await self.redis.setex(key, ttl, data)
+        if settings.L0_CACHE_ENABLED:
+            local_cache.set(key, data, ttl)
+    
+    async def _mget(self, keys: List[str]) -> List[Optional[bytes]]:
+        """Read many keys through L0, fetching only L0 misses from Redis"""
+        if not settings.L0_CACHE_ENABLED:
+            values = await self.redis.mget(keys)
+            for key, data in zip(keys, values):
+                local_cache.record_redis(key, data is not None)
+            return values
+        
+        values = [local_cache.get(key) for key in keys]
+        missing = [i for i, data in enumerate(values) if data is None]
+        if missing:
+            pipe = self.redis.pipeline(transaction=False)
+            pipe.mget([keys[i] for i in missing])
+            for i in missing:
+                pipe.pttl(keys[i])
+            fetched, *pttls = await pipe.execute()
+            for i, data, pttl in zip(missing, fetched, pttls):
+                local_cache.record_redis(keys[i], data is not None)
+                self._fill_l0(keys[i], data, pttl)
+                values[i] = data
+        return values
+    
     async def get_answer(self, query: str, history_hash: str = "") -> Optional[str]:
         """L1: Get cached complete answer"""
-        key = f"chat:answer:{self._hash_key(query + history_hash)}"
-        data = await self.redis.get(key)
+        key = await self._key("answers", self._hash_key(query + history_hash))
+        data = await self._get(key)
         return data.decode() if data else None
     
     async def set_answer(self, query: str, answer: str, history_hash: str = ""):
         """L1: Cache complete answer"""
-        key = f"chat:answer:{self._hash_key(query + history_hash)}"
-        await self.redis.setex(key, self.L1_TTL, answer.encode())
+        key = await self._key("answers", self._hash_key(query + history_hash))
+        await self._set(key, self.L1_TTL, answer.encode())
+    
+    async def get_answer_ttl(self, query: str, history_hash: str = "") -> int:
+        """L1: Remaining lifetime of a cached answer in seconds (negative if missing)"""
+        key = await self._key("answers", self._hash_key(query + history_hash))
+        return await self.redis.ttl(key)
+    
+    @staticmethod
+    def _normalize_query(query: str) -> str:
+        """Case- and whitespace-insensitive form of a query"""
+        return " ".join(query.lower().split())
+    
+    @classmethod
+    def rerank_id(cls, query: str, contents: List[str], top_n: int) -> str:
+        """Hash of normalized query, top_n and the candidate set"""
+        candidates = hashlib.sha1("\x1f".join(contents).encode()).hexdigest()
+        return cls._hash_key(f"{cls._normalize_query(query)}:{top_n}:{candidates}")
+    
+    async def _rerank_key(self, query: str, contents: List[str], top_n: int) -> str:
+        """Key on normalized query, top_n and a stable hash of the candidates"""
+        return await self._key("rerank", self.rerank_id(query, contents, top_n))
+    
+    async def get_rerank(self, query: str, contents: List[str], top_n: int) -> Optional[list]:
+        """Get cached rerank results as [(index, relevance_score), ...]"""
+        data = await self._get(await self._rerank_key(query, contents, top_n))
+        return msgpack.unpackb(data) if data else None
+    
+    async def set_rerank(self, query: str, contents: List[str], top_n: int, results: list):
+        """Cache rerank results as [(index, relevance_score), ...]"""
+        key = await self._rerank_key(query, contents, top_n)
+        await self._set(key, self.RERANK_TTL, msgpack.packb(results))
     
     async def get_docs(self, query: str) -> Optional[list]:
         """L2: Get cached retrieval results"""
-        key = f"chat:docs:{self._hash_key(query)}"
-        data = await self.redis.get(key)
-        return msgpack.unpackb(data) if data else None
+        key = await self._key("docs", self._hash_key(query))
+        data = await self._get(key)
+        return unpack_docs(data) if data else None
     
     async def set_docs(self, query: str, docs: list):
         """L2: Cache retrieval results"""
-        key = f"chat:docs:{self._hash_key(query)}"
-        await self.redis.setex(key, self.L2_TTL, msgpack.packb(docs))
+        key = await self._key("docs", self._hash_key(query))
+        await self._set(key, self.L2_TTL, pack_docs(docs))
     
-    async def get_embedding(self, text: str) -> Optional[list]:
-        """L3: Get cached embedding"""
-        key = f"embedding:query:{self._hash_key(text)}"
-        data = await self.redis.get(key)
-        return msgpack.unpackb(data) if data else None
+    async def get_embedding(self, text: str, model: str = "") -> Optional[np.ndarray]:
+        """L3: Get cached embedding as a read-only float32 array"""
+        key = await self._key("embeddings", self._hash_key(text))
+        data = await self._get(key)
+        return unpack_embedding(data, model) if data else None
     
-    async def set_embedding(self, text: str, embedding: list):
+    async def set_embedding(self, text: str, embedding: Any, model: str = ""):
         """L3: Cache embedding"""
-        key = f"embedding:query:{self._hash_key(text)}"
-        await self.redis.setex(key, self.L3_TTL, msgpack.packb(embedding))
+        key = await self._key("embeddings", self._hash_key(text))
+        await self._set(key, self.L3_TTL, pack_embedding(embedding, model))
+    
+    async def get_embeddings(self, texts: List[str], model: str = "") -> List[Optional[np.ndarray]]:
+        """L3: Get cached embeddings for many texts in one round trip"""
+        prefix = await cache_generations.prefix(self.redis, "embeddings")
+        keys = [prefix + self._hash_key(text) for text in texts]
+        values = await self._mget(keys)
+        return [unpack_embedding(data, model) if data else None for data in values]
+    
+    async def set_embeddings(self, items: Dict[str, Any], model: str = ""):
+        """L3: Cache many embeddings in one pipeline"""
+        prefix = await cache_generations.prefix(self.redis, "embeddings")
+        pipe = self.redis.pipeline(transaction=False)
+        for text, embedding in items.items():
+            key = prefix + self._hash_key(text)
+            data = pack_embedding(embedding, model)
+            pipe.setex(key, self.L3_TTL, data)
+            if settings.L0_CACHE_ENABLED:
+                local_cache.set(key, data, self.L3_TTL)
+        await pipe.execute()
+    
+    async def get_suggestions(self) -> Optional[list]:
+        """Get cached suggested questions"""
+        data = await self._get(await self._key("suggestions", "default"))
+        return json.loads(data) if data else None
+    
+    async def set_suggestions(self, suggestions: list, ttl: int = 300):
+        """Cache suggested questions"""
+        key = await self._key("suggestions", "default")
+        await self._set(key, ttl, json.dumps(suggestions).encode())
     
     async def clear_all(self):
-        """Clear all cache"""
-        await self.redis.flushdb()
+        """Clear all cache families (other Redis data is left alone)"""
+        await cache_generations.bump(self.redis)
+
+
+class SemanticCache:
+    """Answer cache matched by query embedding similarity"""
+    
+    # Stats survive clears; the index and entries live in the current generation
+    STATS_KEY = "chat:semantic:stats"
+    
+    # Decoded entries shared by all instances in this process; entries are
+    # immutable once written, so only unseen IDs are fetched from Redis.
+    # They belong to the generation whose entry prefix is `_local_prefix`.
+    _local: Dict[str, tuple] = {}
+    _local_prefix = ""
+    
+    def __init__(self, redis_client: redis.Redis):
+        self.redis = redis_client
+        self.ttl = CacheManager.L1_TTL
+        self.threshold = settings.SEMANTIC_CACHE_THRESHOLD
+        self.max_entries = settings.SEMANTIC_CACHE_MAX_ENTRIES
+    
+    async def _keys(self) -> Tuple[str, str]:
+        """(index key, entry key prefix) in the current generation"""
+        prefix = await cache_generations.prefix(self.redis, "semantic")
+        return f"{prefix}index", f"{prefix}entry:"
+    
+    async def _load_entries(self) -> List[str]:
+        """Evict stale entries and sync the local copy with the Redis index"""
+        index_key, entry_prefix = await self._keys()
+        pipe = self.redis.pipeline(transaction=False)
+        pipe.zremrangebyscore(index_key, 0, time.time() - self.ttl)
+        pipe.zrevrange(index_key, 0, self.max_entries - 1)
+        _, ids = await pipe.execute()
+        ids = [i.decode() for i in ids]
+        
+        if entry_prefix != SemanticCache._local_prefix:
+            self._local.clear()
+            SemanticCache._local_prefix = entry_prefix
+        
+        missing = [i for i in ids if i not in self._local]
+        if missing:
+            values = await self.redis.mget([entry_prefix + i for i in missing])
+            for entry_id, data in zip(missing, values):
+                if not data:
+                    continue
+                entry = msgpack.unpackb(data)
+                vector = np.frombuffer(entry["e"], dtype=np.float32)
+                self._local[entry_id] = (vector, entry["q"], entry["a"])
+        
+        live = set(ids)
+        for entry_id in [i for i in self._local if i not in live]:
+            del self._local[entry_id]
+        
+        return [i for i in ids if i in self._local]
+    
+    async def lookup(self, embedding: List[float]) -> Optional[Dict[str, Any]]:
+        """
+        Find the cached answer closest to the query embedding
+        
+        Returns:
+            Matched entry (id, query, answer, similarity) or None
+        """
+        ids = await self._load_entries()
+        
+        match = None
+        query = np.asarray(embedding, dtype=np.float32)
+        norm = np.linalg.norm(query)
+        if ids and norm > 0:
+            matrix = np.stack([self._local[i][0] for i in ids])
+            scores = matrix @ (query / norm)
+            best = int(np.argmax(scores))
+            if scores[best] >= self.threshold:
+                _, cached_query, answer = self._local[ids[best]]
+                match = {
+                    "id": ids[best],
+                    "query": cached_query,
+                    "answer": answer,
+                    "similarity": float(scores[best]),
+                }
+        
+        await self.redis.hincrby(self.STATS_KEY, "hits" if match else "misses", 1)
+        return match
+    
+    async def add(self, query: str, embedding: List[float], answer: str) -> str:
+        """Store an answer with its normalized query embedding"""
+        entry_id = CacheManager._hash_key(query)
+        vector = np.asarray(embedding, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        if norm > 0:
+            vector = vector / norm
+        
+        entry = msgpack.packb({
+            "q": query,
+            "e": vector.astype("<f4").tobytes(),
+            "a": answer,
+        })
+        
+        index_key, entry_prefix = await self._keys()
+        pipe = self.redis.pipeline(transaction=False)
+        pipe.setex(entry_prefix + entry_id, self.ttl, entry)
+        pipe.zadd(index_key, {entry_id: time.time()})
+        # Keep only the newest entries
+        pipe.zremrangebyrank(index_key, 0, -(self.max_entries + 1))
+        await pipe.execute()
+        return entry_id
+    
+    async def get_stats(self) -> Dict[str, Any]:
+        """Get hit/miss counters and current entry count"""
+        stats = await self.redis.hgetall(self.STATS_KEY)
+        hits = int(stats.get(b"hits", 0))
+        misses = int(stats.get(b"misses", 0))
+        total = hits + misses
+        return {
+            "hits": hits,
+            "misses": misses,
+            "hit_rate": round(hits / total, 4) if total else 0.0,
+            "entries": await self.redis.zcard((await self._keys())[0]),
+            "threshold": self.threshold,
+        }
+
+
+# Cost per API call (in CNY)
+COST_TABLE = {
+    "embedding": 0.0005,      # ~0.5元/千次
+    "rerank": 0.003,          # ~3元/千次
+    "llm.tokens": 0.000002,   # ~2元/百万token
+    "llm.requests": 0.001,    # 估算每次请求成本
+}
+
+
+def metric_key(metric: str, day: str) -> str:
+    """Daily counter key"""
+    return f"metrics:{metric}:daily:{day}"
+
+
+def cost_rollup_key(period: str) -> str:
+    """
+    Cost rollup hash for a day ("2024-05-01") or month ("2024-05")
+    
+    Fields: `count:{metric}`, `cost:{metric}` and `cost:total`, with unit
+    costs from COST_TABLE applied when the increments are written.
+    """
+    kind = "daily" if len(period) > 7 else "monthly"
+    return f"metrics:cost:{kind}:{period}"
+
+
+class MetricsBuffer:
+    """
+    In-process aggregation of metric increments
+    
+    Increments add up in memory and are written by a background task in one
+    pipeline per flush interval, so request paths never wait on Redis for
+    metrics. EXPIRE is only sent the first time this process writes a key.
+    Billed metrics also update the daily and monthly cost rollups.
+    """
+    
+    METRIC_TTL = 86400 * 30  # 30 days expiry
+    MONTHLY_ROLLUP_TTL = 86400 * 400
+    
+    def __init__(self):
+        self._pending: Dict[Tuple[str, str], int] = defaultdict(int)
+        self._expiry_set: set = set()
+    
+    def add(self, metric: str, day: str, value: int):
+        """Queue an increment"""
+        self._pending[(metric, day)] += value
+    
+    def pending(self, metric: str, day: str) -> int:
+        """Increment not yet written to Redis"""
+        return self._pending.get((metric, day), 0)
+    
+    def pending_costs(self, period: str) -> Dict[str, float]:
+        """Unflushed rollup fields for a day or month, same layout as the hash"""
+        fields: Dict[str, float] = defaultdict(float)
+        for (metric, day), value in self._pending.items():
+            if metric in COST_TABLE and day.startswith(period):
+                cost = value * COST_TABLE[metric]
+                fields[f"count:{metric}"] += value
+                fields[f"cost:{metric}"] += cost
+                fields["cost:total"] += cost
+        return fields
+    
+    async def flush(self) -> int:
+        """Write all pending increments and cost rollups in one pipeline"""
+        if not self._pending:
+            return 0
+        
+        batch, self._pending = self._pending, defaultdict(int)
+        keys = {}
+        try:
+            redis_client = await get_redis()
+            pipe = redis_client.pipeline(transaction=True)
+            for (metric, day), value in batch.items():
+                key = metric_key(metric, day)
+                keys[key] = self.METRIC_TTL
+                pipe.incrby(key, value)
+                
+                if metric in COST_TABLE:
+                    cost = value * COST_TABLE[metric]
+                    for period, ttl in ((day, self.METRIC_TTL), (day[:7], self.MONTHLY_ROLLUP_TTL)):
+                        rollup = cost_rollup_key(period)
+                        keys[rollup] = ttl
+                        pipe.hincrby(rollup, f"count:{metric}", value)
+                        pipe.hincrbyfloat(rollup, f"cost:{metric}", cost)
+                        pipe.hincrbyfloat(rollup, "cost:total", cost)
+            
+            for key, ttl in keys.items():
+                if key not in self._expiry_set:
+                    pipe.expire(key, ttl)
+            await pipe.execute()
+        except (redis.ConnectionError, redis.TimeoutError):
+            # Keep the deltas for the next flush
+            for entry, value in batch.items():
+                self._pending[entry] += value
+            raise
+        
+        # Daily keys roll over, so only remember the ones still being written
+        self._expiry_set = set(keys)
+        return len(batch)
+    
+    async def run(self, interval_ms: float):
+        """Background task: flush on a fixed interval"""
+        while True:
+            await asyncio.sleep(interval_ms / 1000)
+            try:
+                await self.flush()
+            except Exception as e:
+                logger.warning(f"Metrics flush failed, will retry: {e}")
+
+
+# Singleton instance
+metrics_buffer = MetricsBuffer()
+
+
+# KEYS: monthly rollup, daily rollups, then daily counters (day-major)
+# ARGV: force, daily TTL, monthly TTL, day count, metric count, metrics, unit costs
+REBUILD_ROLLUPS_SCRIPT = """
+local force, day_ttl, month_ttl = ARGV[1] == '1', ARGV[2], ARGV[3]
+local ndays, nmetrics = tonumber(ARGV[4]), tonumber(ARGV[5])
+if not force and redis.call('EXISTS', KEYS[1]) == 1 then
+    return 0
+end
+
+local monthly, order = {}, {}
+local function add(fields, field, value)
+    if fields[field] == nil then
+        table.insert(order, field)
+        fields[field] = 0
+    end
+    fields[field] = fields[field] + value
+end
+
+for i = 1, ndays do
+    local daily = {}
+    local total = 0
+    for j = 1, nmetrics do
+        local count = tonumber(redis.call('GET', KEYS[1 + ndays + (i - 1) * nmetrics + j]) or '0')
+        if count > 0 then
+            local metric = ARGV[5 + j]
+            local cost = count * tonumber(ARGV[5 + nmetrics + j])
+            table.insert(daily, 'count:' .. metric)
+            table.insert(daily, count)
+            table.insert(daily, 'cost:' .. metric)
+            table.insert(daily, cost)
+            total = total + cost
+            add(monthly, 'count:' .. metric, count)
+            add(monthly, 'cost:' .. metric, cost)
+        end
+    end
+    if #daily > 0 then
+        table.insert(daily, 'cost:total')
+        table.insert(daily, total)
+        add(monthly, 'cost:total', total)
+        redis.call('DEL', KEYS[1 + i])
+        redis.call('HSET', KEYS[1 + i], unpack(daily))
+        redis.call('EXPIRE', KEYS[1 + i], day_ttl)
+    end
+end
+
+redis.call('DEL', KEYS[1])
+if #order > 0 then
+    local fields = {}
+    for _, field in ipairs(order) do
+        table.insert(fields, field)
+        table.insert(fields, monthly[field])
+    end
+    redis.call('HSET', KEYS[1], unpack(fields))
+    redis.call('EXPIRE', KEYS[1], month_ttl)
+end
+return 1
+"""
 
 
 class CostMetrics:
@@ -84,27 +816,252 @@ class CostMetrics:
         self.redis = redis_client
     
     async def increment(self, metric: str, value: int = 1):
-        """Increment counter"""
+        """Increment counter (buffered, see MetricsBuffer)"""
         from datetime import date
-        today = date.today().isoformat()
-        key = f"metrics:{metric}:daily:{today}"
-        await self.redis.incrby(key, value)
-        await self.redis.expire(key, 86400 * 30)  # 30 days expiry
+        metrics_buffer.add(metric, date.today().isoformat(), value)
     
     async def get_daily_stats(self, metric: str, days: int = 7) -> dict:
         """Get stats for last N days using batch fetch"""
         from datetime import date, timedelta
         
         dates = [(date.today() - timedelta(days=i)).isoformat() for i in range(days)]
-        keys = [f"metrics:{metric}:daily:{d}" for d in dates]
+        keys = [metric_key(metric, d) for d in dates]
         
         values = await self.redis.mget(keys)
         
-        return {d: int(v) if v else 0 for d, v in zip(dates, values)}
+        return {
+            d: int(v or 0) + metrics_buffer.pending(metric, d)
+            for d, v in zip(dates, values)
+        }
     
     async def get_today_count(self, metric: str) -> int:
         """Get today's count"""
         from datetime import date
-        key = f"metrics:{metric}:daily:{date.today().isoformat()}"
-        value = await self.redis.get(key)
-        return int(value) if value else 0
+        today = date.today().isoformat()
+        value = await self.redis.get(metric_key(metric, today))
+        return int(value or 0) + metrics_buffer.pending(metric, today)
+    
+    async def get_cost_rollups(self, *periods: str) -> List[Dict[str, float]]:
+        """
+        Cost rollup fields for each day/month, including unflushed increments
+        
+        Returns:
+            One dict per period with `count:{metric}`, `cost:{metric}` and `cost:total`
+        """
+        pipe = self.redis.pipeline(transaction=False)
+        for period in periods:
+            pipe.hgetall(cost_rollup_key(period))
+        
+        rollups = []
+        for period, stored in zip(periods, await pipe.execute()):
+            fields = metrics_buffer.pending_costs(period)
+            for field, value in stored.items():
+                fields[field.decode()] += float(value)
+            rollups.append(dict(fields))
+        return rollups
+    
+    async def rebuild_cost_rollups(self, month: str, force: bool = False) -> bool:
+        """
+        Recompute a month's rollups from the daily counters (e.g. after upgrading)
+        
+        Runs as one Lua script, so increments flushed concurrently are either
+        already in the counters it reads or applied on top of its result.
+        Unless forced, nothing is rebuilt when the monthly hash already exists.
+        
+        Returns:
+            True if the rollups were rebuilt
+        """
+        from datetime import date, timedelta
+        
+        first = date.fromisoformat(f"{month}-01")
+        days = []
+        d = first
+        while d.month == first.month and d <= date.today():
+            days.append(d.isoformat())
+            d += timedelta(days=1)
+        
+        metrics = list(COST_TABLE)
+        keys = (
+            [cost_rollup_key(month)]
+            + [cost_rollup_key(day) for day in days]
+            + [metric_key(m, day) for day in days for m in metrics]
+        )
+        args = [
+            int(force), MetricsBuffer.METRIC_TTL, MetricsBuffer.MONTHLY_ROLLUP_TTL,
+            len(days), len(metrics), *metrics, *(COST_TABLE[m] for m in metrics),
+        ]
+        script = self.redis.register_script(REBUILD_ROLLUPS_SCRIPT)
+        return bool(await script(keys=keys, args=args))
+
+
+class HotQueryTracker:
+    """
+    Query frequency and cache hit tracking for TTL tuning and cache warming
+    
+    Queries are normalized and counted in an exponentially decayed sorted set
+    (half-life HOT_QUERY_HALF_LIFE_HOURS, trimmed to HOT_QUERY_MAX_TRACKED),
+    with a parallel set for cache hits and a HyperLogLog for distinct queries.
+    Recording only touches process memory; a background task flushes the
+    buffered counts in one pipeline.
+    """
+    
+    COUNTS_KEY = "stats:hot_queries"
+    HITS_KEY = "stats:hot_queries:hits"
+    SAMPLES_KEY = "stats:hot_queries:samples"  # normalized -> latest raw form
+    DISTINCT_KEY = "stats:hot_queries:distinct"
+    DECAYED_AT_KEY = "stats:hot_queries:decayed_at"  # Unix time of the last decay
+    DECAY_LOCK_KEY = "stats:hot_queries:decay_lock"
+    DECAY_LOCK_TTL = 60
+    DECAY_INTERVAL_SECONDS = 600
+    
+    def __init__(self, max_tracked: int, half_life_hours: float):
+        self.max_tracked = max_tracked
+        self.half_life_hours = half_life_hours
+        self._counts: Dict[str, int] = defaultdict(int)
+        self._hits: Dict[str, int] = defaultdict(int)
+        self._samples: Dict[str, str] = {}
+    
+    @staticmethod
+    def normalize(query: str) -> str:
+        """Case-, whitespace- and trailing-punctuation-insensitive form"""
+        return " ".join(query.lower().split()).rstrip("?？!！.。~～ ")
+    
+    def record(self, query: str, cache_hit: bool):
+        """Count one query (no I/O)"""
+        key = self.normalize(query)
+        if not key:
+            return
+        self._counts[key] += 1
+        if cache_hit:
+            self._hits[key] += 1
+        self._samples[key] = query
+    
+    async def flush(self) -> int:
+        """Write buffered counts in one pipeline"""
+        if not self._counts:
+            return 0
+        
+        counts, self._counts = self._counts, defaultdict(int)
+        hits, self._hits = self._hits, defaultdict(int)
+        samples, self._samples = self._samples, {}
+        
+        try:
+            redis_client = await get_redis()
+            pipe = redis_client.pipeline(transaction=False)
+            for key, count in counts.items():
+                pipe.zincrby(self.COUNTS_KEY, count, key)
+            for key, count in hits.items():
+                pipe.zincrby(self.HITS_KEY, count, key)
+            pipe.hset(self.SAMPLES_KEY, mapping=samples)
+            pipe.pfadd(self.DISTINCT_KEY, *counts)
+            # Keep only the most frequent queries
+            pipe.zremrangebyrank(self.COUNTS_KEY, 0, -(self.max_tracked + 1))
+            pipe.zremrangebyrank(self.HITS_KEY, 0, -(self.max_tracked + 1))
+            await pipe.execute()
+        except (redis.ConnectionError, redis.TimeoutError):
+            # Keep the counts for the next flush
+            for key, count in counts.items():
+                self._counts[key] += count
+            for key, count in hits.items():
+                self._hits[key] += count
+            for key, sample in samples.items():
+                self._samples.setdefault(key, sample)
+            raise
+        return len(counts)
+    
+    async def run(self, interval_ms: float):
+        """Background task: flush on a fixed interval"""
+        while True:
+            await asyncio.sleep(interval_ms / 1000)
+            try:
+                await self.flush()
+            except Exception as e:
+                logger.warning(f"Hot query flush failed: {e}")
+    
+    async def decay(self, min_score: float = 0.1) -> bool:
+        """
+        Scheduled job: age all counts and forget queries that faded out
+        
+        Counts are multiplied by 0.5 ** (elapsed / half-life) since the last
+        decay, whose time is kept in Redis. Restarts therefore never skip
+        aging, and workers running the job in turn only apply the time since
+        the previous run. A short lock keeps two workers from applying the
+        same interval at once.
+        
+        Returns:
+            True if this call applied a decay
+        """
+        redis_client = await get_redis()
+        if not await redis_client.set(self.DECAY_LOCK_KEY, 1, nx=True, ex=self.DECAY_LOCK_TTL):
+            return False
+        try:
+            now = time.time()
+            last = await redis_client.get(self.DECAYED_AT_KEY)
+            if last is None:
+                # First run: start the clock
+                await redis_client.set(self.DECAYED_AT_KEY, now)
+                return False
+            
+            elapsed = now - float(last)
+            if elapsed <= 0:
+                return False
+            factor = 0.5 ** (elapsed / (self.half_life_hours * 3600))
+            
+            pipe = redis_client.pipeline(transaction=True)
+            pipe.zunionstore(self.COUNTS_KEY, {self.COUNTS_KEY: factor})
+            pipe.zremrangebyscore(self.COUNTS_KEY, 0, min_score)
+            # Hits decay alike and are kept only for queries still counted
+            pipe.zinterstore(self.HITS_KEY, {self.HITS_KEY: factor, self.COUNTS_KEY: 0})
+            pipe.set(self.DECAYED_AT_KEY, now)
+            pipe.zrange(self.COUNTS_KEY, 0, -1)
+            pipe.hkeys(self.SAMPLES_KEY)
+            *_, live, sampled = await pipe.execute()
+        finally:
+            await redis_client.delete(self.DECAY_LOCK_KEY)
+        
+        stale = set(sampled) - set(live)
+        if stale:
+            await redis_client.hdel(self.SAMPLES_KEY, *stale)
+        return True
+    
+    async def top(self, limit: int = 20) -> List[Dict[str, Any]]:
+        """
+        Most frequent queries with decayed counts and cache hit ratio
+        
+        Returns:
+            [{query, normalized, count, hits, hit_ratio}, ...] most frequent first
+        """
+        redis_client = await get_redis()
+        ranked = await redis_client.zrevrange(self.COUNTS_KEY, 0, limit - 1, withscores=True)
+        if not ranked:
+            return []
+        
+        keys = [key for key, _ in ranked]
+        pipe = redis_client.pipeline(transaction=False)
+        pipe.zmscore(self.HITS_KEY, keys)
+        pipe.hmget(self.SAMPLES_KEY, keys)
+        hits, samples = await pipe.execute()
+        
+        result = []
+        for (key, count), hit, sample in zip(ranked, hits, samples):
+            hit = min(hit or 0.0, count)
+            result.append({
+                "query": (sample or key).decode(),
+                "normalized": key.decode(),
+                "count": round(count, 2),
+                "hits": round(hit, 2),
+                "hit_ratio": round(hit / count, 4) if count else 0.0,
+            })
+        return result
+    
+    async def distinct_count(self) -> int:
+        """Approximate number of distinct queries ever seen"""
+        redis_client = await get_redis()
+        return await redis_client.pfcount(self.DISTINCT_KEY)
+
+
+# Singleton instance
+hot_queries = HotQueryTracker(
+    max_tracked=settings.HOT_QUERY_MAX_TRACKED,
+    half_life_hours=settings.HOT_QUERY_HALF_LIFE_HOURS,
+)
@@ -0,0 +1,132 @@
+"""
+Single-flight request coalescing - within a worker and across workers via Redis
+"""
+import asyncio
+import uuid
+from typing import Any, Awaitable, Callable, Dict
+import logging
+
+import msgpack
+
+from app.core.config import get_settings
+from app.core.redis import get_redis
+
+settings = get_settings()
+logger = logging.getLogger(__name__)
+
+# Only release the lock if we still own it
+RELEASE_LOCK_SCRIPT = """
+if redis.call("get", KEYS[1]) == ARGV[1] then
+    return redis.call("del", KEYS[1])
+end
+return 0
+"""
+
+
+def _pack_default(obj: Any) -> Any:
+    """msgpack fallback for array results (e.g. float32 embeddings)"""
+    if hasattr(obj, "tolist"):
+        return obj.tolist()
+    raise TypeError(f"Cannot serialize {type(obj).__name__}")
+
+
+class SingleFlight:
+    """
+    Run one execution per key and share its result with concurrent callers
+
+    Callers in the same process await the leader's future. Callers in other
+    workers see the leader's Redis lock and wait for the result it publishes
+    under a short-lived key, running the call themselves if it never appears.
+    """
+
+    POLL_INTERVAL = 0.025  # seconds
+    RESULT_TTL_MS = 5000
+
+    def __init__(self, namespace: str):
+        self.namespace = namespace
+        self._inflight: Dict[str, asyncio.Future] = {}
+
+    def _lock_key(self, key: str) -> str:
+        return f"singleflight:{self.namespace}:lock:{key}"
+
+    def _result_key(self, key: str) -> str:
+        return f"singleflight:{self.namespace}:result:{key}"
+
+    async def do(self, key: str, fn: Callable[[], Awaitable[Any]]) -> Any:
+        """Run fn once for all concurrent callers sharing the same key"""
+        future = self._inflight.get(key)
+        if future is not None:
+            try:
+                return await asyncio.shield(future)
+            except asyncio.CancelledError:
+                if not future.cancelled():
+                    raise
+                # The leader was cancelled, not us: run the call ourselves
+                return await fn()
+
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = future
+        try:
+            result = await self._run_distributed(key, fn)
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as e:
+            future.set_exception(e)
+            future.exception()  # Mark retrieved when nobody else is waiting
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            self._inflight.pop(key, None)
+
+    async def _run_distributed(self, key: str, fn: Callable[[], Awaitable[Any]]) -> Any:
+        """Coordinate with other workers through a short-lived Redis lock"""
+        try:
+            redis_client = await get_redis()
+            token = uuid.uuid4().hex
+            acquired = await redis_client.set(
+                self._lock_key(key), token, nx=True, px=settings.SINGLEFLIGHT_LOCK_TTL_MS
+            )
+        except Exception as e:
+            logger.warning(f"Single-flight lock unavailable, running locally: {e}")
+            return await fn()
+
+        if not acquired:
+            found, result = await self._wait_for_result(redis_client, key)
+            if found:
+                logger.debug(f"Single-flight {self.namespace} result shared for {key}")
+                return result
+            return await fn()
+
+        try:
+            result = await fn()
+            try:
+                await redis_client.set(
+                    self._result_key(key),
+                    msgpack.packb(result, default=_pack_default),
+                    px=self.RESULT_TTL_MS,
+                )
+            except Exception as e:
+                logger.warning(f"Single-flight result not published: {e}")
+            return result
+        finally:
+            await redis_client.eval(RELEASE_LOCK_SCRIPT, 1, self._lock_key(key), token)
+
+    async def _wait_for_result(self, redis_client, key: str) -> tuple:
+        """Poll for the leader's result until its lock is released or expires"""
+        lock_key = self._lock_key(key)
+        result_key = self._result_key(key)
+
+        while True:
+            # Check the lock first: the leader publishes before releasing it
+            pipe = redis_client.pipeline(transaction=False)
+            pipe.exists(lock_key)
+            pipe.get(result_key)
+            locked, data = await pipe.execute()
+            if data:
+                return True, msgpack.unpackb(data)
+            if not locked:
+                return False, None
+            await asyncio.sleep(self.POLL_INTERVAL)
@@ -0,0 +1,101 @@
+"""
+Server-sent events encoding - JSON event framing with delta coalescing
+"""
+import asyncio
+import json
+from typing import AsyncIterator, Optional
+
+from app.core.config import get_settings
+
+settings = get_settings()
+
+# End-of-stream sentinel understood by the frontend
+DONE_EVENT = "data: [DONE]\n\n"
+
+
+def format_event(delta: str, event_id: int) -> str:
+    """
+    Encode one text delta as an SSE event
+
+    The payload is JSON, so newlines and other control characters inside
+    the delta can never break the `data:` framing.
+    """
+    payload = json.dumps({"delta": delta}, ensure_ascii=False)
+    return f"id: {event_id}\ndata: {payload}\n\n"
+
+
+class SSEEncoder:
+    """
+    Turn a stream of text deltas into SSE events
+
+    The first delta is sent immediately so the time to first token is
+    unchanged. Later deltas are merged until `window_ms` has passed since
+    the last event or `max_chars` are buffered, then sent as one event.
+    """
+
+    def __init__(
+        self,
+        window_ms: Optional[float] = None,
+        max_chars: Optional[int] = None,
+    ):
+        self.window = (window_ms if window_ms is not None else settings.SSE_COALESCE_MS) / 1000
+        self.max_chars = max_chars if max_chars is not None else settings.SSE_MAX_CHUNK_CHARS
+
+    async def encode(self, deltas: AsyncIterator[str]) -> AsyncIterator[str]:
+        """Yield coalesced events followed by the [DONE] sentinel"""
+        loop = asyncio.get_running_loop()
+        iterator = deltas.__aiter__()
+        buffer = []
+        buffered = 0
+        event_id = 0
+        deadline = 0.0
+        next_delta = None
+
+        def flush() -> str:
+            nonlocal buffered, event_id, deadline
+            text = "".join(buffer)
+            buffer.clear()
+            buffered = 0
+            event_id += 1
+            deadline = loop.time() + self.window
+            return format_event(text, event_id)
+
+        try:
+            while True:
+                if next_delta is None:
+                    next_delta = asyncio.ensure_future(iterator.__anext__())
+
+                # Only wait on the clock while something is buffered
+                timeout = max(deadline - loop.time(), 0) if buffer else None
+                done, _ = await asyncio.wait({next_delta}, timeout=timeout)
+                if not done:
+                    yield flush()
+                    continue
+
+                task, next_delta = next_delta, None
+                try:
+                    delta = task.result()
+                except StopAsyncIteration:
+                    break
+                if not delta:
+                    continue
+
+                buffer.append(delta)
+                buffered += len(delta)
+                if event_id == 0 or buffered >= self.max_chars or loop.time() >= deadline:
+                    yield flush()
+
+            if buffer:
+                yield flush()
+            yield DONE_EVENT
+        finally:
+            if next_delta is not None:
+                next_delta.cancel()
+
+    def replay(self, text: str) -> AsyncIterator[str]:
+        """Encode complete text (e.g. a cached answer) in max-size events"""
+        async def chunks():
+            for i in range(0, len(text), self.max_chars):
+                yield text[i:i + self.max_chars]
+
+        return self.encode(chunks())
@@ -1,6 +1,8 @@
 """
 Personal Homepage + AI Agent Backend
 """
+import asyncio
+
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 
@@ -9,6 +11,11 @@ from app.api.chat import router as chat_router
 from app.api.admin import router as admin_router
 from app.api.profile import router as profile_router
 from app.core.database import init_db
+from app.core.http import http_clients
+from app.core.redis import listen_for_invalidations, metrics_buffer, hot_queries
+from app.services.cost_monitor import cost_monitor
+from app.services.vector_index import vector_index
+from app.services.lexical import lexical_index
 from app.tasks.scheduler import init_scheduler, shutdown_scheduler
 
 settings = get_settings()
@@ -31,17 +38,56 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Background tasks: L0 cache invalidations published by other workers, and
+# periodic flushing of buffered metric increments and hot-query counts
+invalidation_listener = None
+metrics_flusher = None
+hot_query_flusher = None
+
 # Lifecycle events
 @app.on_event("startup")
 async def startup_event():
-    """Initialize database and scheduler on application startup"""
+    """Initialize database, upstream clients, cache listener, search indexes and scheduler on application startup"""
+    global invalidation_listener, metrics_flusher, hot_query_flusher
     await init_db()
+    http_clients.startup()
+    invalidation_listener = asyncio.create_task(listen_for_invalidations())
+    # Before the first flush, which would create this month's rollup hash
+    try:
+        await cost_monitor.ensure_rollups()
+    except Exception as e:
+        print(f"⚠ Cost rollup rebuild failed: {e}")
+    metrics_flusher = asyncio.create_task(metrics_buffer.run(settings.METRICS_FLUSH_INTERVAL_MS))
+    hot_query_flusher = asyncio.create_task(hot_queries.run(settings.METRICS_FLUSH_INTERVAL_MS))
+    if settings.VECTOR_INDEX_ENABLED:
+        try:
+            await vector_index.load()
+        except Exception as e:
+            # Retrieval falls back to pgvector until the next refresh succeeds
+            print(f"⚠ Vector index load failed: {e}")
+    if settings.RETRIEVAL_MODE == "hybrid":
+        try:
+            await lexical_index.load()
+        except Exception as e:
+            # Retrieval stays vector-only until the next refresh succeeds
+            print(f"⚠ Lexical index load failed: {e}")
     init_scheduler()
 
 @app.on_event("shutdown")
 async def shutdown_event():
-    """Shutdown scheduler on application shutdown"""
+    """Shutdown scheduler, background tasks and upstream connections on application shutdown"""
     shutdown_scheduler()
+    if invalidation_listener is not None:
+        invalidation_listener.cancel()
+    for task in (metrics_flusher, hot_query_flusher):
+        if task is not None:
+            task.cancel()
+    try:
+        await metrics_buffer.flush()
+        await hot_queries.flush()
+    except Exception as e:
+        print(f"⚠ Final metrics flush failed: {e}")
+    await http_clients.shutdown()
 
 # Register routers
 app.include_router(chat_router)
@@ -5,9 +5,8 @@ from datetime import datetime
 from typing import Optional, List
 from sqlalchemy import String, Text, ARRAY, Integer, ForeignKey, DateTime
 from sqlalchemy.orm import Mapped, mapped_column
-from pgvector.sqlalchemy import Vector
 
-from app.core.database import Base
+from app.core.database import Base, BinaryVector
 
 
 class PersonalInfo(Base):
@@ -50,9 +49,11 @@ class Embedding(Base):
     
     id: Mapped[int] = mapped_column(primary_key=True)
     content: Mapped[str] = mapped_column(Text, nullable=False)
-    embedding = mapped_column(Vector(1024), nullable=False)
+    embedding = mapped_column(BinaryVector(1024), nullable=False)
     source_type: Mapped[str] = mapped_column(String(50), nullable=False, index=True)
     source_id: Mapped[Optional[int]] = mapped_column(Integer)
+    # sha256 of embedding model + content, used by incremental imports
+    content_hash: Mapped[Optional[str]] = mapped_column(String(64), index=True)
     created_at: Mapped[datetime] = mapped_column(
         DateTime(timezone=True), 
         default=datetime.utcnow
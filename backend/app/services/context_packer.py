@@ -0,0 +1,182 @@
+"""
+Context packer - Fit system prompt, retrieved documents and history into an input token budget
+"""
+import math
+import re
+from typing import List, Dict, Any
+import logging
+
+from app.core.config import get_settings
+from app.services.lexical import tokenize
+
+settings = get_settings()
+logger = logging.getLogger(__name__)
+
+CJK_PATTERN = re.compile(r"[\u3000-\u303f\u3400-\u4dbf\u4e00-\u9fff\uff00-\uffef]")
+
+CONTEXT_PREFIX = "以下是与用户问题相关的信息：\n\n"
+CONTEXT_HEADER = "## 相关信息：\n"
+
+# Chat-format overhead per message (role markers, separators)
+MESSAGE_OVERHEAD = 4
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    Rough token count for mixed Chinese/English text
+
+    CJK characters and full-width punctuation count as one token each,
+    other text as one token per four characters.
+    """
+    cjk = len(CJK_PATTERN.findall(text))
+    return cjk + math.ceil((len(text) - cjk) / 4)
+
+
+def truncate_to_tokens(text: str, max_tokens: int) -> str:
+    """Cut text to at most max_tokens estimated tokens"""
+    if estimate_tokens(text) <= max_tokens:
+        return text
+
+    used = 0.0
+    for i, char in enumerate(text):
+        used += 1 if CJK_PATTERN.match(char) else 0.25
+        if used > max_tokens:
+            return text[:i].rstrip() + "…"
+    return text
+
+
+def is_overlapping(a_tokens: set, b_tokens: set, threshold: float) -> bool:
+    """Whether most of the smaller document is contained in the other"""
+    smaller = min(len(a_tokens), len(b_tokens))
+    if not smaller:
+        return False
+    return len(a_tokens & b_tokens) / smaller >= threshold
+
+
+class ContextPacker:
+    """
+    Build LLM messages within `LLM_INPUT_TOKEN_BUDGET`
+
+    The system prompt and query are always kept. Documents (best first) are
+    deduplicated and added until their share of the budget runs out, the
+    last one trimmed to fit. History is kept newest first; turns that do not
+    fit are replaced by a one-line summary of the earlier questions.
+    """
+
+    HISTORY_SHARE = 0.3       # Budget reserved for history when it has content
+    MIN_DOC_TOKENS = 64       # Don't bother including a document trimmed below this
+    OVERLAP_THRESHOLD = 0.8   # Token containment ratio treated as duplicate content
+
+    def __init__(self, budget: int = None):
+        self.budget = budget or settings.LLM_INPUT_TOKEN_BUDGET
+
+    def dedupe_documents(self, documents: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Drop documents largely contained in a more relevant one"""
+        kept, kept_tokens = [], []
+        for doc in documents:
+            tokens = set(tokenize(doc["content"]))
+            if any(is_overlapping(tokens, other, self.OVERLAP_THRESHOLD) for other in kept_tokens):
+                continue
+            kept.append(doc)
+            kept_tokens.append(tokens)
+        return kept
+
+    def _pack_documents(self, documents: List[Dict[str, Any]], budget: int) -> tuple:
+        """(document texts in relevance order, tokens used) within the budget"""
+        parts = []
+        remaining = budget
+        for doc in self.dedupe_documents(documents):
+            text = f"[{len(parts) + 1}] {doc['content']}"
+            cost = estimate_tokens(text) + 1
+            if cost <= remaining:
+                parts.append(text)
+                remaining -= cost
+                continue
+            if remaining >= self.MIN_DOC_TOKENS:
+                parts.append(truncate_to_tokens(text, remaining - 1))
+                remaining = 0
+            break
+        return parts, budget - remaining
+
+    def _pack_history(self, history: List[Dict[str, str]], budget: int) -> tuple:
+        """(kept messages, summary of dropped turns or "") within the budget"""
+        kept = []
+        remaining = budget
+        for i in range(len(history) - 1, -1, -1):
+            cost = estimate_tokens(history[i]["content"]) + MESSAGE_OVERHEAD
+            if cost > remaining:
+                break
+            kept.insert(0, history[i])
+            remaining -= cost
+
+        dropped = history[:len(history) - len(kept)]
+        # Don't start the kept history with a dangling assistant reply
+        while kept and kept[0]["role"] == "assistant":
+            dropped.append(kept.pop(0))
+
+        summary = ""
+        questions = [m["content"] for m in dropped if m["role"] == "user"]
+        if questions:
+            summary = truncate_to_tokens(
+                "此前访客还问过：" + "；".join(q[:60] for q in questions),
+                max(remaining - MESSAGE_OVERHEAD, 0),
+            )
+        return kept, summary if estimate_tokens(summary) > 8 else ""
+
+    def pack(
+        self,
+        system_prompt: str,
+        query: str,
+        documents: List[Dict[str, Any]],
+        history: List[Dict[str, str]] = None,
+    ) -> Dict[str, Any]:
+        """
+        Build the message list
+
+        Returns:
+            Dict with `messages`, estimated input `tokens`, and the number of
+            `documents` and `history` messages included
+        """
+        history = history or []
+        fixed = (
+            estimate_tokens(system_prompt)
+            + estimate_tokens(query)
+            + estimate_tokens(CONTEXT_PREFIX + CONTEXT_HEADER)
+            + 3 * MESSAGE_OVERHEAD
+        )
+        available = max(self.budget - fixed, 0)
+
+        history_tokens = sum(estimate_tokens(m["content"]) + MESSAGE_OVERHEAD for m in history)
+        history_reserve = min(history_tokens, int(available * self.HISTORY_SHARE))
+
+        doc_parts, doc_tokens = self._pack_documents(documents, available - history_reserve)
+        context = CONTEXT_HEADER + "\n".join(doc_parts) if doc_parts else "没有找到相关信息。"
+
+        # History gets whatever the documents left over
+        kept_history, summary = self._pack_history(history, available - doc_tokens)
+
+        messages = [
+            {"role": "system", "content": system_prompt},
+            {"role": "system", "content": CONTEXT_PREFIX + context},
+        ]
+        if summary:
+            messages.append({"role": "system", "content": summary})
+        messages.extend(kept_history)
+        messages.append({"role": "user", "content": query})
+
+        tokens = sum(estimate_tokens(m["content"]) + MESSAGE_OVERHEAD for m in messages)
+        logger.debug(
+            f"Packed prompt: {tokens}/{self.budget} tokens, "
+            f"{len(doc_parts)}/{len(documents)} documents, "
+            f"{len(kept_history)}/{len(history)} history messages"
+        )
+        return {
+            "messages": messages,
+            "tokens": tokens,
+            "documents": len(doc_parts),
+            "history": len(kept_history),
+        }
+
+
+# Singleton instance
+context_packer = ContextPacker()
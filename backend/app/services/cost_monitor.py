@@ -1,24 +1,16 @@
 """
 Cost monitoring and alerting service
 """
-from datetime import date, timedelta
+from datetime import date
 from typing import Dict, Any
 import logging
 
 from app.core.config import get_settings
-from app.core.redis import get_redis, CostMetrics
+from app.core.redis import get_redis, CostMetrics, COST_TABLE, cost_rollup_key
 
 settings = get_settings()
 logger = logging.getLogger(__name__)
 
-# Cost per API call (in CNY)
-COST_TABLE = {
-    "embedding": 0.0005,      # ~0.5元/千次
-    "rerank": 0.003,          # ~3元/千次
-    "llm.tokens": 0.000002,   # ~2元/百万token
-    "llm.requests": 0.001,    # 估算每次请求成本
-}
-
 
 class CostMonitor:
     """Monitor and alert on API costs"""
@@ -27,66 +19,51 @@ class CostMonitor:
         self.daily_limit = settings.DAILY_EMBEDDING_LIMIT
         self.monthly_budget = settings.MONTHLY_BUDGET_CNY
     
-    async def get_daily_cost(self) -> Dict[str, Any]:
-        """Get today's cost breakdown"""
+    async def _get_rollups(self) -> tuple:
+        """Today's and this month's cost rollups in one round trip"""
+        redis_client = await get_redis()
+        today = date.today()
+        daily, monthly = await CostMetrics(redis_client).get_cost_rollups(
+            today.isoformat(), today.strftime("%Y-%m")
+        )
+        return daily, monthly
+    
+    async def ensure_rollups(self):
+        """Build this month's rollups from the daily counters if they don't exist yet"""
         redis_client = await get_redis()
-        metrics = CostMetrics(redis_client)
+        month = date.today().strftime("%Y-%m")
+        if await redis_client.exists(cost_rollup_key(month)):
+            return
+        # Only one worker rebuilds
+        if await redis_client.set(f"metrics:cost:rebuild:{month}", 1, nx=True, ex=60):
+            if await CostMetrics(redis_client).rebuild_cost_rollups(month):
+                print(f"✅ Cost rollups rebuilt for {month}")
+    
+    async def get_daily_cost(self, rollup: Dict[str, float] = None) -> Dict[str, Any]:
+        """Get today's cost breakdown"""
+        if rollup is None:
+            rollup, _ = await self._get_rollups()
         
         costs = {}
-        total = 0.0
-        
-        for metric, unit_cost in COST_TABLE.items():
-            count = await metrics.get_today_count(metric)
-            cost = count * unit_cost
+        for metric in COST_TABLE:
             costs[metric] = {
-                "count": count,
-                "cost": round(cost, 4),
+                "count": int(rollup.get(f"count:{metric}", 0)),
+                "cost": round(rollup.get(f"cost:{metric}", 0.0), 4),
             }
-            total += cost
         
         return {
             "date": date.today().isoformat(),
             "breakdown": costs,
-            "total_cost": round(total, 4),
+            "total_cost": round(rollup.get("cost:total", 0.0), 4),
             "daily_budget": round(self.monthly_budget / 30, 2),
         }
     
-    async def get_monthly_cost(self) -> Dict[str, Any]:
+    async def get_monthly_cost(self, rollup: Dict[str, float] = None) -> Dict[str, Any]:
         """Get current month's cost"""
-        redis_client = await get_redis()
-        
-        total = 0.0
-        days_in_month = 31
-        keys = []
-        metrics_list = list(COST_TABLE.keys())
+        if rollup is None:
+            _, rollup = await self._get_rollups()
         
-        # Collect all keys for the current month
-        for i in range(days_in_month):
-            d = date.today() - timedelta(days=i)
-            if d.month != date.today().month:
-                break
-            for metric in metrics_list:
-                keys.append(f"metrics:{metric}:daily:{d.isoformat()}")
-        
-        if not keys:
-            return {
-                "month": date.today().strftime("%Y-%m"),
-                "total_cost": 0.0,
-                "budget": self.monthly_budget,
-                "remaining": self.monthly_budget,
-                "percentage": 0.0,
-            }
-
-        # Batch fetch from Redis
-        values = await redis_client.mget(keys)
-        
-        # Calculate total
-        for key, value in zip(keys, values):
-            if value:
-                # Extract metric from key: "metrics:{metric}:daily:..."
-                metric = key.split(":")[1]
-                unit_cost = COST_TABLE.get(metric, 0)
-                total += int(value) * unit_cost
+        total = rollup.get("cost:total", 0.0)
         
         return {
             "month": date.today().strftime("%Y-%m"),
@@ -96,15 +73,21 @@ class CostMonitor:
             "percentage": round((total / self.monthly_budget) * 100, 1) if self.monthly_budget > 0 else 0,
         }
     
-    async def check_limits(self, monthly_stats: Dict[str, Any] = None) -> Dict[str, Any]:
+    async def check_limits(
+        self,
+        monthly_stats: Dict[str, Any] = None,
+        daily_stats: Dict[str, Any] = None,
+    ) -> Dict[str, Any]:
         """Check if any limits are exceeded"""
-        redis_client = await get_redis()
-        metrics = CostMetrics(redis_client)
+        if monthly_stats is None or daily_stats is None:
+            daily_rollup, monthly_rollup = await self._get_rollups()
+            daily_stats = daily_stats or await self.get_daily_cost(daily_rollup)
+            monthly_stats = monthly_stats or await self.get_monthly_cost(monthly_rollup)
         
         warnings = []
         
         # Check embedding limit
-        embedding_count = await metrics.get_today_count("embedding")
+        embedding_count = daily_stats["breakdown"]["embedding"]["count"]
         if embedding_count >= settings.DAILY_EMBEDDING_LIMIT:
             warnings.append({
                 "type": "embedding_limit",
@@ -119,7 +102,7 @@ class CostMonitor:
             })
         
         # Check monthly budget
-        monthly = monthly_stats or await self.get_monthly_cost()
+        monthly = monthly_stats
         if monthly["percentage"] >= 100:
             warnings.append({
                 "type": "budget_exceeded",
@@ -141,10 +124,11 @@ class CostMonitor:
     
     async def get_dashboard_data(self) -> Dict[str, Any]:
         """Get complete dashboard data"""
-        # Optimize by getting data in one flow
-        daily = await self.get_daily_cost()
-        monthly = await self.get_monthly_cost()
-        limits = await self.check_limits(monthly_stats=monthly)
+        # Both rollups come from a single pipelined read
+        daily_rollup, monthly_rollup = await self._get_rollups()
+        daily = await self.get_daily_cost(daily_rollup)
+        monthly = await self.get_monthly_cost(monthly_rollup)
+        limits = await self.check_limits(monthly_stats=monthly, daily_stats=daily)
         
         return {
             "daily": daily,
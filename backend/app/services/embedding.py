@@ -1,13 +1,17 @@
 """
 Embedding service - Aliyun DashScope integration
 """
-import httpx
-from typing import List, Optional
+import asyncio
+from typing import Awaitable, Callable, List, Optional, Set, Tuple
 from tenacity import retry, stop_after_attempt, wait_exponential
 import logging
 
+import numpy as np
+
 from app.core.config import get_settings
+from app.core.http import http_clients
 from app.core.redis import get_redis, CacheManager, CostMetrics
+from app.core.singleflight import SingleFlight
 
 settings = get_settings()
 logger = logging.getLogger(__name__)
@@ -15,6 +19,79 @@ logger = logging.getLogger(__name__)
 DASHSCOPE_EMBEDDING_URL = "https://dashscope.aliyuncs.com/api/v1/services/embeddings/text-embedding/text-embedding"
 
 
+class EmbeddingBatcher:
+    """
+    Micro-batching dispatcher for single-text embedding requests
+    
+    Concurrent submissions are collected for up to `window_ms` or until
+    `max_batch_size` texts are pending, then sent in one API call and the
+    vectors are fanned back out to each caller.
+    """
+    
+    def __init__(
+        self,
+        call_api: Callable[[List[str]], Awaitable[List[List[float]]]],
+        window_ms: float,
+        max_batch_size: int,
+    ):
+        self._call_api = call_api
+        self.window = window_ms / 1000
+        self.max_batch_size = max_batch_size
+        self._pending: List[Tuple[str, asyncio.Future]] = []
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._tasks: Set[asyncio.Task] = set()
+    
+    async def submit(self, text: str) -> List[float]:
+        """Queue a text for the next batch and wait for its embedding"""
+        if self.window <= 0 or self.max_batch_size <= 1:
+            return (await self._call_api([text]))[0]
+        
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((text, future))
+        
+        if len(self._pending) >= self.max_batch_size:
+            self._flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.window, self._flush)
+        
+        return await future
+    
+    def _flush(self):
+        """Dispatch everything pending as one batch"""
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        
+        batch, self._pending = self._pending, []
+        if not batch:
+            return
+        
+        task = asyncio.create_task(self._dispatch(batch))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+    
+    async def _dispatch(self, batch: List[Tuple[str, asyncio.Future]]):
+        """Call the API once and resolve each caller's future"""
+        texts = [text for text, _ in batch]
+        logger.info(f"Dispatching embedding batch of {len(texts)}")
+        try:
+            embeddings = await self._call_api(texts)
+            if len(embeddings) != len(texts):
+                raise ValueError(
+                    f"Embedding API returned {len(embeddings)} vectors for {len(texts)} texts"
+                )
+        except Exception as e:
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        
+        for (_, future), embedding in zip(batch, embeddings):
+            if not future.done():
+                future.set_result(embedding)
+
+
 class EmbeddingService:
     """Service for text embedding using Aliyun DashScope"""
     
@@ -22,6 +99,12 @@ class EmbeddingService:
         self.api_key = settings.DASHSCOPE_API_KEY
         self.model = "text-embedding-v3"
         self.dimension = 1024
+        self._flight = SingleFlight("embedding")
+        self._batcher = EmbeddingBatcher(
+            self._call_api,
+            window_ms=settings.EMBEDDING_BATCH_WINDOW_MS,
+            max_batch_size=settings.EMBEDDING_BATCH_MAX_SIZE,
+        )
     
     @retry(
         stop=stop_after_attempt(3),
@@ -29,71 +112,98 @@ class EmbeddingService:
     )
     async def _call_api(self, texts: List[str]) -> List[List[float]]:
         """Call DashScope embedding API with retry"""
-        async with httpx.AsyncClient(timeout=30.0) as client:
-            response = await client.post(
-                DASHSCOPE_EMBEDDING_URL,
-                headers={
-                    "Authorization": f"Bearer {self.api_key}",
-                    "Content-Type": "application/json",
-                },
-                json={
-                    "model": self.model,
-                    "input": {"texts": texts},
-                    "parameters": {"dimension": self.dimension},
-                },
-            )
-            response.raise_for_status()
-            data = response.json()
-            
-            if "output" not in data or "embeddings" not in data["output"]:
-                raise ValueError(f"Unexpected API response: {data}")
-            
-            # Sort by index and extract embeddings
-            embeddings = sorted(
-                data["output"]["embeddings"], 
-                key=lambda x: x["text_index"]
-            )
-            return [e["embedding"] for e in embeddings]
+        client = http_clients.for_service("embedding")
+        response = await client.post(
+            DASHSCOPE_EMBEDDING_URL,
+            headers={
+                "Authorization": f"Bearer {self.api_key}",
+                "Content-Type": "application/json",
+            },
+            json={
+                "model": self.model,
+                "input": {"texts": texts},
+                "parameters": {"dimension": self.dimension},
+            },
+            timeout=http_clients.timeout("embedding"),
+        )
+        response.raise_for_status()
+        data = response.json()
+        
+        if "output" not in data or "embeddings" not in data["output"]:
+            raise ValueError(f"Unexpected API response: {data}")
+        
+        # Sort by index and extract embeddings
+        embeddings = sorted(
+            data["output"]["embeddings"], 
+            key=lambda x: x["text_index"]
+        )
+        return [e["embedding"] for e in embeddings]
     
-    async def embed_text(self, text: str) -> List[float]:
-        """Embed a single text with caching"""
+    async def embed_text(self, text: str) -> np.ndarray:
+        """Embed a single text with caching, returning a float32 vector"""
         redis_client = await get_redis()
         cache = CacheManager(redis_client)
         metrics = CostMetrics(redis_client)
         
         # Check cache first
-        cached = await cache.get_embedding(text)
-        if cached:
+        cached = await cache.get_embedding(text, self.model)
+        if cached is not None:
             logger.debug(f"Embedding cache hit for: {text[:50]}...")
             return cached
         
-        # Call API
-        logger.info(f"Calling embedding API for: {text[:50]}...")
-        embeddings = await self._call_api([text])
-        embedding = embeddings[0]
-        
-        # Cache result
-        await cache.set_embedding(text, embedding)
-        
-        # Track metrics
-        await metrics.increment("embedding")
+        # Identical concurrent misses share one API call
+        async def fetch() -> np.ndarray:
+            logger.info(f"Calling embedding API for: {text[:50]}...")
+            embedding = np.asarray(await self._batcher.submit(text), dtype=np.float32)
+            
+            # Cache result
+            await cache.set_embedding(text, embedding, self.model)
+            
+            # Track metrics
+            await metrics.increment("embedding")
+            
+            return embedding
         
-        return embedding
+        embedding = await self._flight.do(cache._hash_key(text), fetch)
+        # Results shared across workers arrive as plain lists
+        return np.asarray(embedding, dtype=np.float32)
     
-    async def embed_texts(self, texts: List[str]) -> List[List[float]]:
-        """Embed multiple texts (batch)"""
+    async def embed_texts(self, texts: List[str]) -> List[np.ndarray]:
+        """Embed multiple texts (batch) as float32 vectors, only sending cache misses to the API"""
         if not texts:
             return []
         
         redis_client = await get_redis()
+        cache = CacheManager(redis_client)
         metrics = CostMetrics(redis_client)
         
-        # For batch, skip individual caching to simplify
-        logger.info(f"Batch embedding {len(texts)} texts")
-        embeddings = await self._call_api(texts)
+        embeddings = await cache.get_embeddings(texts, self.model)
+        
+        # Unique texts that still need embedding, in first-seen order
+        missing = list(dict.fromkeys(
+            text for text, embedding in zip(texts, embeddings) if embedding is None
+        ))
+        logger.info(f"Batch embedding {len(texts)} texts ({len(missing)} cache misses)")
         
-        # Track metrics
-        await metrics.increment("embedding", len(texts))
+        if missing:
+            fetched = {}
+            batch_size = settings.EMBEDDING_BATCH_MAX_SIZE
+            for i in range(0, len(missing), batch_size):
+                batch = missing[i:i + batch_size]
+                fetched.update(
+                    (text, np.asarray(embedding, dtype=np.float32))
+                    for text, embedding in zip(batch, await self._call_api(batch))
+                )
+            
+            await cache.set_embeddings(fetched, self.model)
+            
+            # Track metrics (only texts actually billed)
+            await metrics.increment("embedding", len(fetched))
+            
+            embeddings = [
+                embedding if embedding is not None else fetched[text]
+                for text, embedding in zip(texts, embeddings)
+            ]
         
         return embeddings
 
@@ -0,0 +1,225 @@
+"""
+Lexical matching utilities - CJK-aware tokenization, BM25 scoring and an
+in-memory inverted index over the embeddings table
+"""
+import asyncio
+import math
+import re
+from collections import Counter, defaultdict
+from typing import List, Dict, Any, Optional, Set, Tuple
+import logging
+
+from sqlalchemy import select
+
+from app.core.database import async_session_maker
+from app.core.redis import on_knowledge_change
+from app.models.models import Embedding
+from app.services.vector_index import get_embeddings_fingerprint
+
+logger = logging.getLogger(__name__)
+
+# Latin words (keeping tech names like "c++", "next.js") or runs of CJK characters
+TOKEN_PATTERN = re.compile(r"[a-z0-9][a-z0-9.+#_-]*|[\u3400-\u4dbf\u4e00-\u9fff]+")
+
+
+def _is_cjk(token: str) -> bool:
+    return "\u3400" <= token[0] <= "\u9fff"
+
+
+def tokenize(text: str) -> List[str]:
+    """
+    Split text into lexical tokens
+
+    Latin words are lowercased whole; CJK runs become overlapping character
+    bigrams (a single character stays a unigram), which works well for
+    Chinese without a segmentation dictionary.
+    """
+    tokens = []
+    for match in TOKEN_PATTERN.finditer(text.lower()):
+        token = match.group()
+        if _is_cjk(token) and len(token) > 1:
+            tokens.extend(token[i:i + 2] for i in range(len(token) - 1))
+        else:
+            tokens.append(token.rstrip(".-_"))
+    return [t for t in tokens if t]
+
+
+def bm25_scores(
+    query_tokens: List[str],
+    docs_tokens: List[List[str]],
+    k1: float = 1.2,
+    b: float = 0.75,
+) -> List[float]:
+    """BM25 score of each document against the query, using the given docs as the corpus"""
+    n = len(docs_tokens)
+    if n == 0 or not query_tokens:
+        return [0.0] * n
+
+    avg_len = sum(len(tokens) for tokens in docs_tokens) / n or 1.0
+    doc_freq = Counter()
+    for tokens in docs_tokens:
+        doc_freq.update(set(tokens))
+
+    query_terms = set(query_tokens)
+    scores = []
+    for tokens in docs_tokens:
+        term_freq = Counter(tokens)
+        length_norm = k1 * (1 - b + b * len(tokens) / avg_len)
+        score = 0.0
+        for term in query_terms:
+            tf = term_freq.get(term, 0)
+            if not tf:
+                continue
+            idf = math.log(1 + (n - doc_freq[term] + 0.5) / (doc_freq[term] + 0.5))
+            score += idf * tf * (k1 + 1) / (tf + length_norm)
+        scores.append(score)
+    return scores
+
+
+def overlap_ratio(query_tokens: List[str], doc_tokens: List[str]) -> float:
+    """Fraction of distinct query tokens that appear in the document"""
+    query_terms = set(query_tokens)
+    if not query_terms:
+        return 0.0
+    return len(query_terms & set(doc_tokens)) / len(query_terms)
+
+
+class LexicalIndex:
+    """BM25 inverted index over `embeddings.content`"""
+
+    def __init__(self, k1: float = 1.2, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        # (postings, doc_lengths, docs, fingerprint) is swapped as a whole on reload
+        self._state: Tuple[Dict[str, List[Tuple[int, int]]], List[int], List[Dict[str, Any]], Optional[tuple]] = (
+            {}, [], [], None
+        )
+        # Bumped by invalidate() so loads started before a change are discarded
+        self._epoch = 0
+        self._tasks: Set[asyncio.Task] = set()
+
+    @property
+    def ready(self) -> bool:
+        """Whether the index has been loaded at least once"""
+        return self._state[3] is not None
+
+    @property
+    def size(self) -> int:
+        """Number of indexed documents"""
+        return len(self._state[2])
+
+    def build(self, docs: List[Dict[str, Any]], fingerprint: tuple = ()):
+        """Index documents with content, source_type and source_id"""
+        postings = defaultdict(list)
+        doc_lengths = []
+        for doc_idx, doc in enumerate(docs):
+            tokens = tokenize(doc["content"])
+            doc_lengths.append(len(tokens))
+            for term, tf in Counter(tokens).items():
+                postings[term].append((doc_idx, tf))
+
+        self._state = (dict(postings), doc_lengths, docs, fingerprint)
+
+    async def load(self):
+        """Build the index from the embeddings table"""
+        epoch = self._epoch
+        async with async_session_maker() as session:
+            fingerprint = await get_embeddings_fingerprint(session)
+            result = await session.execute(
+                select(
+                    Embedding.content,
+                    Embedding.source_type,
+                    Embedding.source_id,
+                ).order_by(Embedding.id)
+            )
+            docs = [
+                {
+                    "content": row.content,
+                    "source_type": row.source_type,
+                    "source_id": row.source_id,
+                }
+                for row in result.all()
+            ]
+
+        if epoch != self._epoch:
+            return
+        self.build(docs, fingerprint)
+        logger.info(f"Lexical index loaded with {len(docs)} documents")
+
+    async def refresh(self) -> bool:
+        """Rebuild the index if the knowledge base changed since the last load"""
+        async with async_session_maker() as session:
+            fingerprint = await get_embeddings_fingerprint(session)
+
+        if fingerprint == self._state[3]:
+            return False
+
+        await self.load()
+        return True
+
+    def invalidate(self):
+        """
+        Knowledge base changed: stop serving the old index and rebuild it
+
+        Retrieval is vector-only until the rebuild finishes.
+        """
+        if not self.ready:
+            return
+        self._epoch += 1
+        self._state = ({}, [], [], None)
+        task = asyncio.get_running_loop().create_task(refresh_lexical_index())
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    def search(self, query: str, top_k: int = 10) -> List[Dict[str, Any]]:
+        """
+        BM25 search over the whole corpus
+
+        Returns:
+            Documents with `lexical_score` and `coverage` (fraction of
+            query tokens found in the document), best first
+        """
+        postings, doc_lengths, docs, _ = self._state
+        query_terms = set(tokenize(query))
+        if not docs or not query_terms:
+            return []
+
+        n = len(docs)
+        avg_len = sum(doc_lengths) / n or 1.0
+        scores: Dict[int, float] = defaultdict(float)
+        matched: Dict[int, int] = defaultdict(int)
+
+        for term in query_terms:
+            term_postings = postings.get(term)
+            if not term_postings:
+                continue
+            df = len(term_postings)
+            idf = math.log(1 + (n - df + 0.5) / (df + 0.5))
+            for doc_idx, tf in term_postings:
+                length_norm = self.k1 * (1 - self.b + self.b * doc_lengths[doc_idx] / avg_len)
+                scores[doc_idx] += idf * tf * (self.k1 + 1) / (tf + length_norm)
+                matched[doc_idx] += 1
+
+        ranked = sorted(scores, key=scores.get, reverse=True)[:top_k]
+        return [
+            {
+                **docs[doc_idx],
+                "lexical_score": round(scores[doc_idx], 4),
+                "coverage": matched[doc_idx] / len(query_terms),
+            }
+            for doc_idx in ranked
+        ]
+
+
+# Singleton instance
+lexical_index = LexicalIndex()
+on_knowledge_change(lexical_index.invalidate)
+
+
+async def refresh_lexical_index():
+    """Scheduled job: pick up knowledge base changes"""
+    try:
+        if await lexical_index.refresh():
+            print(f"✅ Lexical index reloaded ({lexical_index.size} documents)")
+    except Exception as e:
+        logger.warning(f"Lexical index refresh failed: {e}")
@@ -0,0 +1,64 @@
+"""
+Local rerank service - CPU reranking from lexical overlap and vector similarity
+"""
+from typing import List, Dict, Any
+
+from app.services.lexical import tokenize, bm25_scores, overlap_ratio
+
+
+class LocalReranker:
+    """
+    Rerank candidates without an API call
+
+    Combines BM25 over the candidate set, query token coverage (Chinese
+    character bigrams / Latin words) and the original vector similarity.
+    """
+
+    def __init__(
+        self,
+        bm25_weight: float = 0.4,
+        overlap_weight: float = 0.2,
+        vector_weight: float = 0.4,
+    ):
+        self.bm25_weight = bm25_weight
+        self.overlap_weight = overlap_weight
+        self.vector_weight = vector_weight
+
+    def score(self, query: str, documents: List[Dict[str, Any]]) -> List[float]:
+        """Relevance score (0-1) of each document"""
+        query_tokens = tokenize(query)
+        docs_tokens = [tokenize(doc["content"]) for doc in documents]
+
+        bm25 = bm25_scores(query_tokens, docs_tokens)
+        max_bm25 = max(bm25, default=0.0) or 1.0
+
+        return [
+            self.bm25_weight * bm25_score / max_bm25
+            + self.overlap_weight * overlap_ratio(query_tokens, doc_tokens)
+            + self.vector_weight * float(doc.get("similarity", 0.0))
+            for doc, doc_tokens, bm25_score in zip(documents, docs_tokens, bm25)
+        ]
+
+    def rerank(
+        self,
+        query: str,
+        documents: List[Dict[str, Any]],
+        top_n: int = 3,
+    ) -> List[Dict[str, Any]]:
+        """Return the top-N documents with a local `rerank_score`"""
+        if not documents:
+            return []
+
+        scores = self.score(query, documents)
+        order = sorted(range(len(documents)), key=lambda i: scores[i], reverse=True)
+
+        reranked = []
+        for idx in order[:top_n]:
+            doc = documents[idx].copy()
+            doc["rerank_score"] = round(scores[idx], 4)
+            reranked.append(doc)
+        return reranked
+
+
+# Singleton instance
+local_reranker = LocalReranker()
@@ -1,13 +1,15 @@
 """
 Rerank service - Aliyun DashScope GTE-Rerank integration
 """
-import httpx
 from typing import List, Dict, Any
 from tenacity import retry, stop_after_attempt, wait_exponential
 import logging
 
 from app.core.config import get_settings
-from app.core.redis import get_redis, CostMetrics
+from app.core.http import http_clients
+from app.core.redis import get_redis, CacheManager, CostMetrics
+from app.core.singleflight import SingleFlight
+from app.services.local_rerank import local_reranker
 
 settings = get_settings()
 logger = logging.getLogger(__name__)
@@ -21,6 +23,7 @@ class RerankService:
     def __init__(self):
         self.api_key = settings.DASHSCOPE_API_KEY
         self.model = "gte-rerank"
+        self._flight = SingleFlight("rerank")
     
     @retry(
         stop=stop_after_attempt(3),
@@ -33,32 +36,33 @@ class RerankService:
         top_n: int = 3
     ) -> List[Dict[str, Any]]:
         """Call DashScope rerank API with retry"""
-        async with httpx.AsyncClient(timeout=10.0) as client:
-            response = await client.post(
-                DASHSCOPE_RERANK_URL,
-                headers={
-                    "Authorization": f"Bearer {self.api_key}",
-                    "Content-Type": "application/json",
+        client = http_clients.for_service("rerank")
+        response = await client.post(
+            DASHSCOPE_RERANK_URL,
+            headers={
+                "Authorization": f"Bearer {self.api_key}",
+                "Content-Type": "application/json",
+            },
+            json={
+                "model": self.model,
+                "input": {
+                    "query": query,
+                    "documents": documents,
                 },
-                json={
-                    "model": self.model,
-                    "input": {
-                        "query": query,
-                        "documents": documents,
-                    },
-                    "parameters": {
-                        "top_n": top_n,
-                        "return_documents": True,
-                    },
+                "parameters": {
+                    "top_n": top_n,
+                    "return_documents": True,
                 },
-            )
-            response.raise_for_status()
-            data = response.json()
-            
-            if "output" not in data or "results" not in data["output"]:
-                raise ValueError(f"Unexpected API response: {data}")
-            
-            return data["output"]["results"]
+            },
+            timeout=http_clients.timeout("rerank"),
+        )
+        response.raise_for_status()
+        data = response.json()
+        
+        if "output" not in data or "results" not in data["output"]:
+            raise ValueError(f"Unexpected API response: {data}")
+        
+        return data["output"]["results"]
     
     async def rerank(
         self, 
@@ -80,38 +84,119 @@ class RerankService:
         if not documents:
             return []
         
-        # Extract content for reranking
-        contents = [doc["content"] for doc in documents]
+        redis_client = await get_redis()
+        metrics = CostMetrics(redis_client)
+        mode = settings.RERANK_MODE
+        
+        if mode == "primary":
+            await metrics.increment("rerank.local")
+            return local_reranker.rerank(query, documents, top_n)
         
         try:
-            # Call rerank API
-            results = await self._call_api(query, contents, top_n)
-            
-            # Track metrics
-            redis_client = await get_redis()
-            metrics = CostMetrics(redis_client)
-            await metrics.increment("rerank")
-            
-            # Map back to original documents
-            reranked = []
-            for result in results:
-                idx = result["index"]
-                doc = documents[idx].copy()
-                doc["rerank_score"] = result["relevance_score"]
-                reranked.append(doc)
-            
-            logger.info(f"Reranked {len(documents)} -> {len(reranked)} docs")
-            return reranked
-            
+            reranked = await self._rerank_remote(query, documents, top_n)
         except Exception as e:
-            # Fallback: return top-N original documents
             logger.warning(f"Rerank failed, using fallback: {e}")
-            
-            redis_client = await get_redis()
-            metrics = CostMetrics(redis_client)
             await metrics.increment("rerank.fallback")
             
-            return documents[:top_n]
+            if mode == "remote":
+                # Plain fallback: top-N original documents
+                return documents[:top_n]
+            return local_reranker.rerank(query, documents, top_n)
+        
+        if mode == "shadow":
+            await self._record_shadow(metrics, query, documents, reranked, top_n)
+        
+        return reranked
+    
+    async def _rerank_remote(
+        self,
+        query: str,
+        documents: List[Dict[str, Any]],
+        top_n: int,
+    ) -> List[Dict[str, Any]]:
+        """Rerank with the DashScope API"""
+        # Extract content for reranking
+        contents = [doc["content"] for doc in documents]
+        
+        redis_client = await get_redis()
+        cache = CacheManager(redis_client)
+        
+        results = await cache.get_rerank(query, contents, top_n)
+        if results is not None:
+            logger.debug(f"Rerank cache hit for: {query[:50]}...")
+        else:
+            async def call_and_track() -> list:
+                api_results = await self._call_api(query, contents, top_n)
+                results = [
+                    [result["index"], result["relevance_score"]]
+                    for result in api_results
+                ]
+                await cache.set_rerank(query, contents, top_n, results)
+                
+                # Track metrics
+                metrics = CostMetrics(redis_client)
+                await metrics.increment("rerank")
+                return results
+            
+            # Call rerank API, once for requests sharing a cache entry
+            flight_key = CacheManager.rerank_id(query, contents, top_n)
+            results = await self._flight.do(flight_key, call_and_track)
+        
+        # Map back to original documents
+        reranked = []
+        for idx, score in results:
+            doc = documents[idx].copy()
+            doc["rerank_score"] = score
+            reranked.append(doc)
+        
+        logger.info(f"Reranked {len(documents)} -> {len(reranked)} docs")
+        return reranked
+    
+    async def _record_shadow(
+        self,
+        metrics: CostMetrics,
+        query: str,
+        documents: List[Dict[str, Any]],
+        remote: List[Dict[str, Any]],
+        top_n: int,
+    ):
+        """Compare the local ranking against the remote one"""
+        local = local_reranker.rerank(query, documents, top_n)
+        
+        remote_top = [doc["content"] for doc in remote]
+        local_top = [doc["content"] for doc in local]
+        overlap = len(set(remote_top) & set(local_top))
+        top1_agree = bool(remote_top and local_top and remote_top[0] == local_top[0])
+        
+        await metrics.increment("rerank.shadow.samples")
+        await metrics.increment("rerank.shadow.slots", len(remote_top))
+        await metrics.increment("rerank.shadow.overlap", overlap)
+        if top1_agree:
+            await metrics.increment("rerank.shadow.top1")
+        
+        logger.info(
+            f"Rerank shadow: overlap {overlap}/{len(remote_top)}, "
+            f"top1 {'agree' if top1_agree else 'differ'} for: {query[:50]}..."
+        )
+    
+    async def get_shadow_agreement(self, days: int = 7) -> Dict[str, Any]:
+        """Agreement between local and remote rankings over the last N days"""
+        redis_client = await get_redis()
+        metrics = CostMetrics(redis_client)
+        
+        totals = {}
+        for name in ["samples", "slots", "overlap", "top1"]:
+            stats = await metrics.get_daily_stats(f"rerank.shadow.{name}", days)
+            totals[name] = sum(stats.values())
+        
+        samples = totals["samples"]
+        return {
+            "mode": settings.RERANK_MODE,
+            "days": days,
+            "samples": samples,
+            "top1_agreement": round(totals["top1"] / samples, 4) if samples else None,
+            "overlap_at_n": round(totals["overlap"] / totals["slots"], 4) if totals["slots"] else None,
+        }
     
     async def rerank_with_fallback(
         self, 
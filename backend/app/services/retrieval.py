@@ -1,16 +1,200 @@
 """
-Retrieval service - Vector search with pgvector
+Retrieval service - Vector search with pgvector, optionally fused with lexical search
 """
-from typing import List, Dict, Any
+import json
+import time
+from typing import List, Dict, Any, Optional
+from pydantic import BaseModel, Field
 from sqlalchemy import text
 from sqlalchemy.ext.asyncio import AsyncSession
 import logging
 
+from app.core.config import get_settings
 from app.core.redis import get_redis, CacheManager
+from app.core.singleflight import SingleFlight
 from app.services.embedding import embedding_service
+from app.services.lexical import lexical_index, tokenize
+from app.services.vector_index import vector_index
 
+settings = get_settings()
 logger = logging.getLogger(__name__)
 
+# Shared by all requests so identical concurrent searches run once
+search_flight = SingleFlight("retrieval")
+
+
+class RetrievalOptions(BaseModel):
+    """Per-query recall/latency knobs for vector search"""
+    top_k: int = Field(default=10, ge=1, le=100)
+    threshold: float = Field(default=0.5, ge=0.0, le=1.0)
+    ef_search: int = Field(default=40, ge=1, le=1000)
+    iterative_scan: str = Field(default="off", pattern="^(off|relaxed_order|strict_order)$")
+    exact_fallback: bool = False
+    rescore_candidates: int = Field(default=40, ge=1, le=1000)
+    
+    @classmethod
+    def from_settings(cls) -> "RetrievalOptions":
+        """Defaults from environment configuration"""
+        return cls(
+            top_k=settings.RETRIEVAL_TOP_K,
+            threshold=settings.RETRIEVAL_THRESHOLD,
+            ef_search=settings.HNSW_EF_SEARCH,
+            iterative_scan=settings.HNSW_ITERATIVE_SCAN,
+            exact_fallback=settings.RETRIEVAL_EXACT_FALLBACK,
+            rescore_candidates=settings.RETRIEVAL_RESCORE_CANDIDATES,
+        )
+
+
+# Runtime overrides set from the admin API, shared by all workers via Redis
+RETRIEVAL_OPTIONS_KEY = "retrieval:options"
+OPTIONS_CACHE_SECONDS = 10
+_options_cache: Dict[str, Any] = {"expires": 0.0, "options": None}
+
+
+async def get_retrieval_options() -> RetrievalOptions:
+    """Active options: Redis override if set, otherwise Settings (cached briefly in process)"""
+    if _options_cache["options"] is not None and time.monotonic() < _options_cache["expires"]:
+        return _options_cache["options"]
+    
+    options = RetrievalOptions.from_settings()
+    try:
+        redis_client = await get_redis()
+        data = await redis_client.get(RETRIEVAL_OPTIONS_KEY)
+        if data:
+            options = RetrievalOptions(**{**options.model_dump(), **json.loads(data)})
+    except Exception as e:
+        logger.warning(f"Retrieval options override unavailable: {e}")
+    
+    _options_cache.update(options=options, expires=time.monotonic() + OPTIONS_CACHE_SECONDS)
+    return options
+
+
+async def set_retrieval_options(options: Optional[RetrievalOptions]):
+    """Store a runtime override (None resets to Settings)"""
+    redis_client = await get_redis()
+    if options is None:
+        await redis_client.delete(RETRIEVAL_OPTIONS_KEY)
+    else:
+        await redis_client.set(RETRIEVAL_OPTIONS_KEY, options.model_dump_json())
+    _options_cache.update(options=None, expires=0.0)
+
+
+# The embedding is a single bound parameter sent in binary float32 (pgvector
+# asyncpg codec), so the statement text is constant and its prepared plan is
+# reused. The distance is computed once per row and reused for ordering, the
+# threshold filter and the similarity.
+FULL_SEARCH_SQL = """
+    SELECT 
+        content,
+        source_type,
+        source_id,
+        1 - distance AS similarity
+    FROM (
+        SELECT content, source_type, source_id, embedding <=> :embedding AS distance
+        FROM embeddings
+        ORDER BY distance
+        LIMIT :limit
+    ) AS nearest
+    WHERE distance <= :max_distance
+    ORDER BY distance
+"""
+
+# Compact storage modes: take candidates from the halfvec / binary HNSW index,
+# then rescore them against the full-precision vectors
+RESCORE_SEARCH_SQL = """
+    SELECT 
+        content,
+        source_type,
+        source_id,
+        1 - distance AS similarity
+    FROM (
+        SELECT content, source_type, source_id, embedding <=> CAST(:embedding AS vector) AS distance
+        FROM (
+            SELECT content, source_type, source_id, embedding
+            FROM embeddings
+            ORDER BY {candidate_order}
+            LIMIT :candidates
+        ) AS candidates
+        ORDER BY distance
+        LIMIT :limit
+    ) AS nearest
+    WHERE distance <= :max_distance
+    ORDER BY distance
+"""
+
+VECTOR_SEARCH_SQL = {
+    "full": text(FULL_SEARCH_SQL),
+    "halfvec": text(RESCORE_SEARCH_SQL.format(
+        candidate_order="(embedding::halfvec(1024)) <=> CAST(CAST(:embedding AS vector) AS halfvec(1024))",
+    )),
+    "binary": text(RESCORE_SEARCH_SQL.format(
+        candidate_order=(
+            "CAST(binary_quantize(embedding) AS bit(1024)) "
+            "<~> binary_quantize(CAST(:embedding AS vector))"
+        ),
+    )),
+}
+
+
+def _search_params(query_embedding: List[float], options: "RetrievalOptions") -> Dict[str, Any]:
+    """Bound parameters for the active vector search statement"""
+    params = {
+        "embedding": query_embedding,
+        "max_distance": 1 - options.threshold,
+        "limit": options.top_k,
+    }
+    if settings.VECTOR_STORAGE_MODE != "full":
+        params["candidates"] = max(options.rescore_candidates, options.top_k)
+    return params
+
+
+def _hybrid_enabled() -> bool:
+    return settings.RETRIEVAL_MODE == "hybrid" and lexical_index.ready
+
+
+def _is_exact_term_match(query: str, lexical_docs: List[Dict[str, Any]]) -> bool:
+    """Short query whose terms all appear in the best lexical hit"""
+    if not lexical_docs or lexical_docs[0]["coverage"] < 1.0:
+        return False
+    return len(set(tokenize(query))) <= settings.RETRIEVAL_KEYWORD_MAX_TOKENS
+
+
+def is_keyword_query(query: str) -> bool:
+    """Whether hybrid retrieval can answer the query without an embedding"""
+    if not _hybrid_enabled():
+        return False
+    return _is_exact_term_match(query, lexical_index.search(query, top_k=1))
+
+
+def reciprocal_rank_fusion(
+    result_lists: List[List[Dict[str, Any]]],
+    top_k: int,
+    k: int = 60,
+) -> List[Dict[str, Any]]:
+    """Fuse ranked result lists by summing 1 / (k + rank)"""
+    scores: Dict[tuple, float] = {}
+    docs: Dict[tuple, Dict[str, Any]] = {}
+    
+    for results in result_lists:
+        for rank, doc in enumerate(results, 1):
+            key = (doc["source_type"], doc["source_id"], doc["content"])
+            scores[key] = scores.get(key, 0.0) + 1.0 / (k + rank)
+            # Keep the first occurrence (vector results carry the real similarity)
+            docs.setdefault(key, doc)
+    
+    ranked = sorted(scores, key=scores.get, reverse=True)[:top_k]
+    return [docs[key] for key in ranked]
+
+
+def _as_retrieved_doc(lexical_doc: Dict[str, Any]) -> Dict[str, Any]:
+    """Lexical hit in the standard result shape, query coverage standing in for similarity"""
+    return {
+        "content": lexical_doc["content"],
+        "source_type": lexical_doc["source_type"],
+        "source_id": lexical_doc["source_id"],
+        "similarity": float(lexical_doc["coverage"]),
+    }
+
 
 class RetrievalService:
     """Service for vector similarity search"""
@@ -21,20 +205,30 @@ class RetrievalService:
     async def search(
         self, 
         query: str, 
-        top_k: int = 10, 
-        threshold: float = 0.5
+        top_k: Optional[int] = None, 
+        threshold: Optional[float] = None,
+        query_embedding: Optional[List[float]] = None,
     ) -> List[Dict[str, Any]]:
         """
         Search for similar documents using vector similarity
         
         Args:
             query: Search query text
-            top_k: Number of results to return
-            threshold: Minimum similarity score (0-1)
+            top_k: Number of results to return (default from retrieval options)
+            threshold: Minimum similarity score 0-1 (default from retrieval options)
+            query_embedding: Precomputed query embedding, if already available
         
         Returns:
             List of documents with content and similarity score
         """
+        options = await get_retrieval_options()
+        if top_k is not None or threshold is not None:
+            options = options.model_copy(update={
+                "top_k": top_k if top_k is not None else options.top_k,
+                "threshold": threshold if threshold is not None else options.threshold,
+            })
+        top_k, threshold = options.top_k, options.threshold
+        
         # Check cache first
         redis_client = await get_redis()
         cache = CacheManager(redis_client)
@@ -44,33 +238,76 @@ class RetrievalService:
             logger.debug(f"Docs cache hit for: {query[:50]}...")
             return cached_docs
         
-        # Get query embedding
-        query_embedding = await embedding_service.embed_text(query)
-        
-        # Convert to string for SQL
-        embedding_str = "[" + ",".join(map(str, query_embedding)) + "]"
+        async def run_search() -> List[Dict[str, Any]]:
+            lexical_docs = []
+            if _hybrid_enabled():
+                lexical_docs = [
+                    doc for doc in lexical_index.search(query, top_k)
+                    if doc["coverage"] >= settings.RETRIEVAL_LEXICAL_MIN_COVERAGE
+                ]
+            
+            embedding = query_embedding
+            if embedding is None and _is_exact_term_match(query, lexical_docs):
+                # Exact-term query: answer from the lexical index, no embedding call
+                docs = [
+                    _as_retrieved_doc(doc) for doc in lexical_docs
+                    if doc["coverage"] >= 1.0
+                ]
+            else:
+                # Get query embedding
+                if embedding is None:
+                    embedding = await embedding_service.embed_text(query)
+                
+                if vector_index.ready:
+                    docs = vector_index.search(embedding, top_k, threshold)
+                else:
+                    docs = await self._search_db(embedding, options)
+                
+                if lexical_docs:
+                    docs = reciprocal_rank_fusion(
+                        [docs, [_as_retrieved_doc(doc) for doc in lexical_docs]],
+                        top_k=top_k,
+                        k=settings.RETRIEVAL_RRF_K,
+                    )
+            
+            # Cache results
+            if docs:
+                await cache.set_docs(query, docs)
+            
+            logger.info(f"Retrieved {len(docs)} docs for: {query[:50]}...")
+            return docs
         
-        # Vector similarity search using cosine distance
-        # 1 - cosine_distance = cosine_similarity
-        # Note: asyncpg requires positional params ($1, $2)
-        sql = text(f"""
-            SELECT 
-                content,
-                source_type,
-                source_id,
-                1 - (embedding <=> '{embedding_str}'::vector) as similarity
-            FROM embeddings
-            WHERE 1 - (embedding <=> '{embedding_str}'::vector) >= :threshold
-            ORDER BY embedding <=> '{embedding_str}'::vector
-            LIMIT :limit
-        """)
+        flight_key = cache._hash_key(f"{query}:{top_k}:{threshold}")
+        return await search_flight.do(flight_key, run_search)
+    
+    async def _apply_search_options(self, options: RetrievalOptions):
+        """Set HNSW search parameters for the current transaction only"""
+        await self.db.execute(
+            text("SELECT set_config('hnsw.ef_search', :ef_search, true)"),
+            {"ef_search": str(options.ef_search)},
+        )
+        # Only pgvector >= 0.8 knows this parameter; leave it unset when off
+        if options.iterative_scan != "off":
+            await self.db.execute(
+                text("SELECT set_config('hnsw.iterative_scan', :mode, true)"),
+                {"mode": options.iterative_scan},
+            )
+    
+    async def _search_db(
+        self,
+        query_embedding: List[float],
+        options: RetrievalOptions,
+        exact: bool = False,
+    ) -> List[Dict[str, Any]]:
+        """Vector similarity search in pgvector"""
+        await self._apply_search_options(options)
+        if exact:
+            # Sequential scan: exact results regardless of HNSW recall
+            await self.db.execute(text("SET LOCAL enable_indexscan = off"))
         
         result = await self.db.execute(
-            sql,
-            {
-                "threshold": threshold,
-                "limit": top_k,
-            }
+            VECTOR_SEARCH_SQL[settings.VECTOR_STORAGE_MODE],
+            _search_params(query_embedding, options),
         )
         
         rows = result.fetchall()
@@ -85,20 +322,39 @@ class RetrievalService:
             for row in rows
         ]
         
-        # Cache results
-        if docs:
-            await cache.set_docs(query, docs)
+        if not docs and options.exact_fallback and not exact:
+            logger.info("No HNSW results above threshold, retrying with exact scan")
+            return await self._search_db(query_embedding, options, exact=True)
         
-        logger.info(f"Retrieved {len(docs)} docs for: {query[:50]}...")
+        if exact:
+            await self.db.execute(text("RESET enable_indexscan"))
         return docs
     
+    async def explain(self, options: RetrievalOptions) -> Dict[str, Any]:
+        """Query plan of the vector search under the given options"""
+        result = await self.db.execute(text("SELECT embedding FROM embeddings LIMIT 1"))
+        sample = result.scalar()
+        if sample is None:
+            return {"plan": [], "ef_search": None, "note": "embeddings table is empty"}
+        
+        await self._apply_search_options(options)
+        result = await self.db.execute(
+            text(f"EXPLAIN {VECTOR_SEARCH_SQL[settings.VECTOR_STORAGE_MODE].text}"),
+            _search_params(sample, options),
+        )
+        plan = [row[0] for row in result.fetchall()]
+        ef_search = (await self.db.execute(text("SHOW hnsw.ef_search"))).scalar()
+        
+        return {"plan": plan, "ef_search": ef_search}
+    
     async def search_with_empty_fallback(
         self, 
         query: str, 
-        top_k: int = 10
+        top_k: Optional[int] = None,
+        query_embedding: Optional[List[float]] = None,
     ) -> List[Dict[str, Any]]:
         """Search with fallback message for empty results"""
-        docs = await self.search(query, top_k)
+        docs = await self.search(query, top_k, query_embedding=query_embedding)
         
         if not docs:
             logger.warning(f"No results found for: {query}")
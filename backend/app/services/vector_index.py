@@ -0,0 +1,168 @@
+"""
+In-process vector index - Exact cosine search over the embeddings table
+"""
+import asyncio
+from typing import List, Dict, Any, Optional, Set, Tuple
+import logging
+
+import numpy as np
+from sqlalchemy import select, func
+
+from app.core.config import get_settings
+from app.core.database import async_session_maker
+from app.core.redis import on_knowledge_change
+from app.models.models import Embedding
+
+settings = get_settings()
+logger = logging.getLogger(__name__)
+
+
+async def get_embeddings_fingerprint(session) -> tuple:
+    """Cheap summary of the embeddings table used to detect changes"""
+    result = await session.execute(
+        select(
+            func.count(Embedding.id),
+            func.max(Embedding.id),
+            func.max(Embedding.created_at),
+        )
+    )
+    return tuple(result.one())
+
+
+class VectorIndex:
+    """
+    Normalized float32 embedding matrix held in process memory
+
+    The knowledge base is small and rarely changes, so an exact
+    matrix-vector product is cheaper than a pgvector round trip.
+    """
+
+    def __init__(self, dimension: int = 1024):
+        self.dimension = dimension
+        # (matrix, rows, fingerprint) is swapped as a whole on reload so
+        # concurrent searches never see a half-built index
+        self._state: Tuple[np.ndarray, List[Dict[str, Any]], Optional[tuple]] = (
+            np.empty((0, dimension), dtype=np.float32),
+            [],
+            None,
+        )
+        # Bumped by invalidate() so loads started before a change are discarded
+        self._epoch = 0
+        self._tasks: Set[asyncio.Task] = set()
+
+    @property
+    def ready(self) -> bool:
+        """Whether the index has been loaded at least once"""
+        return self._state[2] is not None
+
+    @property
+    def size(self) -> int:
+        """Number of indexed rows"""
+        return len(self._state[1])
+
+    async def load(self):
+        """Load all embeddings into a contiguous normalized matrix"""
+        epoch = self._epoch
+        async with async_session_maker() as session:
+            fingerprint = await get_embeddings_fingerprint(session)
+            result = await session.execute(
+                select(
+                    Embedding.content,
+                    Embedding.source_type,
+                    Embedding.source_id,
+                    Embedding.embedding,
+                ).order_by(Embedding.id)
+            )
+            rows = result.all()
+
+        matrix = np.empty((len(rows), self.dimension), dtype=np.float32)
+        meta = []
+        for i, row in enumerate(rows):
+            matrix[i] = row.embedding
+            meta.append({
+                "content": row.content,
+                "source_type": row.source_type,
+                "source_id": row.source_id,
+            })
+
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        matrix /= norms
+
+        if epoch != self._epoch:
+            return
+        self._state = (np.ascontiguousarray(matrix), meta, fingerprint)
+        logger.info(f"Vector index loaded with {len(meta)} embeddings")
+
+    async def refresh(self) -> bool:
+        """Reload the index if the knowledge base changed since the last load"""
+        async with async_session_maker() as session:
+            fingerprint = await get_embeddings_fingerprint(session)
+
+        if fingerprint == self._state[2]:
+            return False
+
+        await self.load()
+        return True
+
+    def invalidate(self):
+        """
+        Knowledge base changed: stop serving the loaded matrix and reload it
+
+        Until the reload finishes `ready` is False and retrieval uses pgvector,
+        so nothing cached after a profile import comes from the old matrix.
+        """
+        if not self.ready:
+            return
+        self._epoch += 1
+        self._state = (np.empty((0, self.dimension), dtype=np.float32), [], None)
+        task = asyncio.get_running_loop().create_task(refresh_vector_index())
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    def search(
+        self,
+        query_embedding: List[float],
+        top_k: int = 10,
+        threshold: float = 0.5,
+    ) -> List[Dict[str, Any]]:
+        """
+        Exact cosine top-k search
+
+        Returns:
+            Documents in the same shape as the pgvector query results
+        """
+        matrix, meta, _ = self._state
+        if not meta:
+            return []
+
+        query = np.asarray(query_embedding, dtype=np.float32)
+        norm = np.linalg.norm(query)
+        if norm == 0:
+            return []
+
+        scores = matrix @ (query / norm)
+
+        k = min(top_k, len(scores))
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+
+        return [
+            {**meta[i], "similarity": float(scores[i])}
+            for i in top
+            if scores[i] >= threshold
+        ]
+
+
+# Singleton instance
+vector_index = VectorIndex()
+on_knowledge_change(vector_index.invalidate)
+
+
+async def refresh_vector_index():
+    """Scheduled job: pick up knowledge base changes"""
+    try:
+        if await vector_index.refresh():
+            print(f"✅ Vector index reloaded ({vector_index.size} embeddings)")
+    except Exception as e:
+        logger.warning(f"Vector index refresh failed: {e}")
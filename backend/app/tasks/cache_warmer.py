@@ -0,0 +1,131 @@
+"""
+Cache Warming Task
+Pre-computes answers for suggested and frequently asked questions so the
+first visitors after an import or a quiet night hit a warm cache
+"""
+import asyncio
+import logging
+from typing import List, Optional
+
+from app.core.config import get_settings, DEFAULT_SUGGESTIONS
+from app.core.database import async_session_maker
+from app.core.redis import get_redis, CacheManager, SemanticCache, hot_queries
+from app.services.cost_monitor import cost_monitor
+from app.services.embedding import embedding_service
+from app.services.retrieval import RetrievalService, is_keyword_query
+from app.services.rerank import rerank_service
+from app.services.llm import llm_service
+
+settings = get_settings()
+logger = logging.getLogger(__name__)
+
+# Held while warming so several workers don't generate the same answers
+WARM_LOCK_KEY = "tasks:cache_warm:lock"
+WARM_LOCK_TTL = 1800
+
+
+async def _within_budget() -> bool:
+    """Warming is optional spend: stop at the first cost warning"""
+    limits = await cost_monitor.check_limits()
+    if limits["status"] != "ok":
+        print(f"Cache warming paused: {[w['type'] for w in limits['warnings']]}")
+        return False
+    return True
+
+
+async def warm_query(query: str, cache: CacheManager, min_ttl: int) -> bool:
+    """
+    Fill embedding, docs, rerank and answer caches for a first-turn query
+
+    Returns:
+        True if an answer was generated, False if it was still fresh
+    """
+    if await cache.get_answer_ttl(query) > min_ttl:
+        return False
+
+    # Same pipeline as /api/chat without history
+    query_embedding = None
+    if not is_keyword_query(query):
+        query_embedding = await embedding_service.embed_text(query)
+
+    async with async_session_maker() as db:
+        docs = await RetrievalService(db).search_with_empty_fallback(
+            query, query_embedding=query_embedding
+        )
+
+    if len(docs) > 1 and docs[0].get("source_type") != "fallback":
+        docs = await rerank_service.rerank(query, docs, top_n=3)
+    else:
+        docs = docs[:3]
+
+    # Raises instead of returning the document fallback, which must not be cached
+    answer = await llm_service.generate(query, docs, fallback=False)
+    if not answer or len(answer) <= 10:
+        return False
+
+    await cache.set_answer(query, answer)
+    if query_embedding is not None and settings.SEMANTIC_CACHE_ENABLED:
+        await SemanticCache(cache.redis).add(query, query_embedding, answer)
+    return True
+
+
+async def warm_cache(queries: Optional[List[str]] = None) -> int:
+    """
+    Warm the answer cache for suggestions and the most frequent queries
+
+    Called on CACHE_WARM_INTERVAL_HOURS and after a profile import. Answers
+    are regenerated once they would expire before the next run. Only one
+    worker warms at a time.
+
+    Args:
+        queries: Explicit queries (default: suggestions + top recorded queries)
+
+    Returns:
+        Number of answers generated
+    """
+    if not settings.CACHE_WARM_ENABLED:
+        return 0
+
+    redis_client = await get_redis()
+    cache = CacheManager(redis_client)
+
+    if not await redis_client.set(WARM_LOCK_KEY, 1, nx=True, ex=WARM_LOCK_TTL):
+        print("Cache warming already running in another worker, skipping")
+        return 0
+    try:
+        return await _warm(cache, queries)
+    finally:
+        await redis_client.delete(WARM_LOCK_KEY)
+
+
+async def _warm(cache: CacheManager, queries: Optional[List[str]]) -> int:
+    """Warm queries with bounded concurrency while the cost budget allows"""
+    if queries is None:
+        queries = list(DEFAULT_SUGGESTIONS)
+        for entry in await hot_queries.top(settings.CACHE_WARM_TOP_N):
+            if entry["query"] not in queries:
+                queries.append(entry["query"])
+
+    # Regenerate answers that would expire before the next scheduled run
+    min_ttl = int(settings.CACHE_WARM_INTERVAL_HOURS * 3600 * 1.5)
+    semaphore = asyncio.Semaphore(settings.CACHE_WARM_CONCURRENCY)
+    stopped = False
+
+    async def warm(query: str) -> bool:
+        nonlocal stopped
+        async with semaphore:
+            if stopped:
+                return False
+            if not await _within_budget():
+                stopped = True
+                return False
+            try:
+                return await warm_query(query, cache, min_ttl)
+            except Exception as e:
+                logger.warning(f"Cache warming failed for {query[:50]}: {e}")
+                return False
+
+    results = await asyncio.gather(*(warm(q) for q in queries))
+    warmed = sum(results)
+    print(f"✅ Cache warmed: {warmed} answers generated, {len(queries) - warmed} skipped")
+    return warmed
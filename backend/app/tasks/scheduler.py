@@ -1,11 +1,21 @@
 """
 APScheduler Configuration and Initialization
 """
+from datetime import datetime, timedelta
+
 from apscheduler.schedulers.asyncio import AsyncIOScheduler
 from apscheduler.triggers.cron import CronTrigger
+from apscheduler.triggers.interval import IntervalTrigger
 from pytz import timezone
 
+from app.core.config import get_settings
+from app.core.redis import sweep_stale_generations, hot_queries
 from app.tasks.github_sync import sync_github_contributions
+from app.tasks.cache_warmer import warm_cache
+from app.services.vector_index import refresh_vector_index
+from app.services.lexical import refresh_lexical_index
+
+settings = get_settings()
 
 
 # Global scheduler instance
@@ -28,6 +38,57 @@ def init_scheduler():
         replace_existing=True
     )
     
+    # Reload the in-process vector index when the knowledge base changes
+    if settings.VECTOR_INDEX_ENABLED:
+        scheduler.add_job(
+            refresh_vector_index,
+            trigger=IntervalTrigger(seconds=settings.VECTOR_INDEX_REFRESH_SECONDS),
+            id='vector_index_refresh',
+            name='Refresh Vector Index',
+            replace_existing=True
+        )
+    
+    if settings.RETRIEVAL_MODE == "hybrid":
+        scheduler.add_job(
+            refresh_lexical_index,
+            trigger=IntervalTrigger(seconds=settings.VECTOR_INDEX_REFRESH_SECONDS),
+            id='lexical_index_refresh',
+            name='Refresh Lexical Index',
+            replace_existing=True
+        )
+    
+    # Remove keys orphaned by cache clears (generation bumps)
+    scheduler.add_job(
+        sweep_stale_generations,
+        trigger=IntervalTrigger(seconds=settings.CACHE_SWEEP_INTERVAL_SECONDS),
+        id='cache_generation_sweep',
+        name='Sweep Stale Cache Generations',
+        replace_existing=True
+    )
+    
+    # Age hot-query counts so the ranking follows recent traffic; decay is
+    # proportional to the time since the last run, so restarts don't skip it
+    scheduler.add_job(
+        hot_queries.decay,
+        trigger=IntervalTrigger(seconds=hot_queries.DECAY_INTERVAL_SECONDS),
+        next_run_time=datetime.now() + timedelta(minutes=1),
+        id='hot_query_decay',
+        name='Decay Hot Query Counts',
+        replace_existing=True
+    )
+    
+    # Pre-answer suggested and popular questions shortly after startup and
+    # then often enough that answers are refreshed before L1_TTL runs out
+    if settings.CACHE_WARM_ENABLED:
+        scheduler.add_job(
+            warm_cache,
+            trigger=IntervalTrigger(hours=settings.CACHE_WARM_INTERVAL_HOURS),
+            next_run_time=datetime.now() + timedelta(minutes=1),
+            id='cache_warm',
+            name='Warm Answer Cache',
+            replace_existing=True
+        )
+    
     scheduler.start()
     print("✅ Scheduler started - GitHub sync scheduled at 3:30 AM daily")
 
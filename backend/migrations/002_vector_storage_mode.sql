@@ -0,0 +1,58 @@
+-- Migration: Switch the HNSW index to a VECTOR_STORAGE_MODE
+-- Created: 2026-10-18
+-- Requires pgvector >= 0.7.0 (halfvec, binary_quantize)
+--
+-- Usage (set VECTOR_STORAGE_MODE to the same value, then restart the backend):
+--   psql -v mode=halfvec -f backend/migrations/002_vector_storage_mode.sql
+--
+-- Modes:
+--   full    - HNSW over the full-precision vectors (default)
+--   halfvec - HNSW over a half-precision expression (~50% of the full index)
+--   binary  - HNSW over binary-quantized vectors (~3% of the full index)
+--
+-- Compact modes rescore candidates against the full-precision column, so no
+-- extra column is stored. The index for the chosen mode is built first and
+-- the other vector indexes are dropped, so only one stays in memory.
+
+SELECT set_config('app.vector_storage_mode', :'mode', false);
+
+DO $$
+DECLARE
+    mode TEXT := current_setting('app.vector_storage_mode');
+BEGIN
+    IF mode NOT IN ('full', 'halfvec', 'binary') THEN
+        RAISE EXCEPTION 'Unknown vector storage mode: %', mode;
+    END IF;
+
+    -- Stored half-precision copy (and its index) from an earlier version of
+    -- this migration; removed first so the expression index can take the name
+    ALTER TABLE embeddings DROP COLUMN IF EXISTS embedding_half;
+
+    -- Build the new index before dropping the old one
+    IF mode = 'full' THEN
+        CREATE INDEX IF NOT EXISTS embeddings_embedding_idx
+        ON embeddings
+        USING hnsw (embedding vector_cosine_ops)
+        WITH (m = 16, ef_construction = 64);
+    ELSIF mode = 'halfvec' THEN
+        CREATE INDEX IF NOT EXISTS embeddings_embedding_half_idx
+        ON embeddings
+        USING hnsw ((embedding::halfvec(1024)) halfvec_cosine_ops)
+        WITH (m = 16, ef_construction = 64);
+    ELSE
+        CREATE INDEX IF NOT EXISTS embeddings_embedding_bit_idx
+        ON embeddings
+        USING hnsw ((binary_quantize(embedding)::bit(1024)) bit_hamming_ops)
+        WITH (m = 16, ef_construction = 64);
+    END IF;
+
+    IF mode <> 'full' THEN
+        DROP INDEX IF EXISTS embeddings_embedding_idx;
+    END IF;
+    IF mode <> 'halfvec' THEN
+        DROP INDEX IF EXISTS embeddings_embedding_half_idx;
+    END IF;
+    IF mode <> 'binary' THEN
+        DROP INDEX IF EXISTS embeddings_embedding_bit_idx;
+    END IF;
+END $$;
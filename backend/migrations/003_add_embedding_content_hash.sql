@@ -0,0 +1,11 @@
+-- Migration: Add content hash to embeddings for incremental imports
+-- Created: 2026-10-18
+
+-- sha256 of "<embedding model>\x1f<embedded text>". The import script diffs
+-- the profile against these hashes and only re-embeds new or changed items.
+-- Existing rows are backfilled by the next import run.
+ALTER TABLE embeddings
+    ADD COLUMN IF NOT EXISTS content_hash VARCHAR(64);
+
+CREATE INDEX IF NOT EXISTS idx_embeddings_content_hash
+ON embeddings(content_hash);
@@ -1,10 +1,17 @@
 #!/usr/bin/env python3
 """
 Import personal profile data into database with vector embeddings
+
+By default only new or changed items are re-embedded and only changed
+knowledge invalidates caches; pass --full to truncate and rebuild.
 """
+import argparse
 import asyncio
+import hashlib
 import json
 import sys
+import time
+from collections import Counter
 from pathlib import Path
 
 # Add parent directory to path
@@ -12,6 +19,7 @@ sys.path.insert(0, str(Path(__file__).parent.parent))
 
 from sqlalchemy import text
 from app.core.database import async_session_maker, engine
+from app.core.http import http_clients
 from app.services.embedding import embedding_service
 
 
@@ -25,122 +33,306 @@ async def clear_existing_data():
         print("✓ Cleared existing data")
 
 
+def load_profile(profile_path: str) -> dict:
+    """Read the profile JSON"""
+    with open(profile_path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def profile_personal_items(data: dict) -> list:
+    """(category, content) pairs of the personal_info section"""
+    items = []
+    for category, values in data.get("personal_info", {}).items():
+        if isinstance(values, list):
+            items.extend((category, item) for item in values)
+        else:
+            items.append((category, str(values)))
+    return items
+
+
+def project_params(project: dict) -> dict:
+    """Row values of a profile project"""
+    return {
+        "name": project.get("name", ""),
+        "description": project.get("description", ""),
+        "tech_stack": project.get("tech_stack", []),
+        "highlights": project.get("highlights", []),
+        "url": project.get("url", ""),
+    }
+
+
+def content_hash(content: str) -> str:
+    """Hash of the embedded text; changes when the text or embedding model changes"""
+    return hashlib.sha256(f"{embedding_service.model}\x1f{content}".encode()).hexdigest()
+
+
+PROJECT_COLUMNS = ["name", "description", "tech_stack", "highlights", "url"]
+EMBEDDING_COLUMNS = ["content", "embedding", "source_type", "source_id", "content_hash"]
+
+
+async def copy_rows(session, table: str, columns: list, records: list) -> int:
+    """
+    Bulk-load rows with a binary COPY on the session's connection
+    
+    Runs inside the session's transaction, starting it first if needed, so
+    it commits or rolls back with the rest of the phase. Vectors go through
+    the pgvector binary codec registered on every connection.
+    """
+    if not records:
+        return 0
+    
+    connection = await session.connection()
+    raw = await connection.get_raw_connection()
+    # The asyncpg adapter sends BEGIN lazily before its own statements only;
+    # a COPY issued first on the driver connection would autocommit
+    if not raw.driver_connection.is_in_transaction():
+        await session.execute(text("SELECT 1"))
+    started = time.perf_counter()
+    await raw.driver_connection.copy_records_to_table(table, records=records, columns=columns)
+    elapsed = time.perf_counter() - started
+    print(f"  ✓ {table}: {len(records)} rows in {elapsed:.3f}s ({len(records) / max(elapsed, 1e-6):,.0f} rows/s)")
+    return len(records)
+
+
 async def import_profile(profile_path: str):
     """Import profile data from JSON file"""
-    with open(profile_path, "r", encoding="utf-8") as f:
-        data = json.load(f)
+    data = load_profile(profile_path)
     
     async with async_session_maker() as session:
-        # Import personal info
-        for category, items in data.get("personal_info", {}).items():
-            if isinstance(items, list):
-                for item in items:
-                    await session.execute(
-                        text("INSERT INTO personal_info (category, content) VALUES (:category, :content)"),
-                        {"category": category, "content": item}
-                    )
+        await copy_rows(session, "personal_info", ["category", "content"], profile_personal_items(data))
+        await copy_rows(
+            session,
+            "projects",
+            PROJECT_COLUMNS,
+            [tuple(project_params(p)[c] for c in PROJECT_COLUMNS) for p in data.get("projects", [])],
+        )
+        await session.commit()
+        print(f"✓ Imported {len(data.get('personal_info', {}))} categories and {len(data.get('projects', []))} projects")
+
+
+async def sync_profile(profile_path: str) -> dict:
+    """
+    Bring personal_info and projects in line with the profile without truncating
+    
+    Unchanged rows keep their IDs, so their embeddings stay valid.
+    """
+    data = load_profile(profile_path)
+    stats = {"added": 0, "updated": 0, "removed": 0}
+    
+    async with async_session_maker() as session:
+        # Personal info: multiset diff on (category, content)
+        wanted = Counter(profile_personal_items(data))
+        result = await session.execute(text("SELECT id, category, content FROM personal_info ORDER BY id"))
+        stale_ids = []
+        for row in result.fetchall():
+            key = (row.category, row.content)
+            if wanted[key] > 0:
+                wanted[key] -= 1
             else:
-                await session.execute(
-                    text("INSERT INTO personal_info (category, content) VALUES (:category, :content)"),
-                    {"category": category, "content": str(items)}
-                )
+                stale_ids.append(row.id)
         
-        # Import projects
-        for project in data.get("projects", []):
+        if stale_ids:
+            await session.execute(
+                text("DELETE FROM personal_info WHERE id = ANY(:ids)"), {"ids": stale_ids}
+            )
+        await copy_rows(
+            session,
+            "personal_info",
+            ["category", "content"],
+            [key for key, count in wanted.items() for _ in range(count)],
+        )
+        stats["added"] += sum(wanted.values())
+        stats["removed"] += len(stale_ids)
+        
+        # Projects: matched by name
+        wanted_projects = {p.get("name", ""): project_params(p) for p in data.get("projects", [])}
+        result = await session.execute(
+            text("SELECT id, name, description, tech_stack, highlights, url FROM projects")
+        )
+        stale_ids = []
+        updates = []
+        for row in result.fetchall():
+            params = wanted_projects.pop(row.name, None)
+            if params is None:
+                stale_ids.append(row.id)
+            elif (
+                row.description, list(row.tech_stack or []), list(row.highlights or []), row.url
+            ) != (params["description"], params["tech_stack"], params["highlights"], params["url"]):
+                updates.append({**params, "id": row.id})
+        
+        if updates:
+            # A list of parameter sets runs as one executemany
             await session.execute(
                 text("""
-                    INSERT INTO projects (name, description, tech_stack, highlights, url)
-                    VALUES (:name, :description, :tech_stack, :highlights, :url)
+                    UPDATE projects
+                    SET description = :description, tech_stack = :tech_stack,
+                        highlights = :highlights, url = :url
+                    WHERE id = :id
                 """),
-                {
-                    "name": project.get("name", ""),
-                    "description": project.get("description", ""),
-                    "tech_stack": project.get("tech_stack", []),
-                    "highlights": project.get("highlights", []),
-                    "url": project.get("url", ""),
-                }
+                updates
             )
+            stats["updated"] += len(updates)
+        if stale_ids:
+            await session.execute(
+                text("DELETE FROM projects WHERE id = ANY(:ids)"), {"ids": stale_ids}
+            )
+        await copy_rows(
+            session,
+            "projects",
+            PROJECT_COLUMNS,
+            [tuple(params[c] for c in PROJECT_COLUMNS) for params in wanted_projects.values()],
+        )
+        stats["added"] += len(wanted_projects)
+        stats["removed"] += len(stale_ids)
         
         await session.commit()
-        print(f"✓ Imported {len(data.get('personal_info', {}))} categories and {len(data.get('projects', []))} projects")
+    
+    print(f"✓ Profile synced: {stats['added']} added, {stats['updated']} updated, {stats['removed']} removed")
+    return stats
+
+
+async def build_documents(session) -> list:
+    """(content, source_type, source_id) of every item to embed"""
+    # Get all personal info
+    result = await session.execute(
+        text("SELECT id, category, content FROM personal_info")
+    )
+    personal_rows = result.fetchall()
+    
+    # Get all projects
+    result = await session.execute(
+        text("SELECT id, name, description, tech_stack, highlights FROM projects")
+    )
+    project_rows = result.fetchall()
+    
+    documents = []
+    for row in personal_rows:
+        documents.append((f"{row.category}: {row.content}", "personal_info", row.id))
+    
+    for row in project_rows:
+        # Create rich text for project
+        tech_str = ", ".join(row.tech_stack) if row.tech_stack else ""
+        highlights_str = "; ".join(row.highlights) if row.highlights else ""
+        content = f"项目: {row.name}\n描述: {row.description}\n技术栈: {tech_str}\n亮点: {highlights_str}"
+        documents.append((content, "project", row.id))
+    
+    return documents
+
+
+async def embed_documents(documents: list) -> list:
+    """Embed documents into embeddings rows (EMBEDDING_COLUMNS order)"""
+    texts = [content for content, _, _ in documents]
+    
+    # Embed in chunks for progress output; the service batches API calls itself
+    chunk_size = 100
+    embeddings = []
+    started = time.perf_counter()
+    for i in range(0, len(texts), chunk_size):
+        embeddings.extend(await embedding_service.embed_texts(texts[i:i + chunk_size]))
+        print(f"  ✓ Embedded {len(embeddings)}/{len(texts)}")
+    elapsed = time.perf_counter() - started
+    print(f"  ✓ Embedding: {len(texts)} texts in {elapsed:.2f}s ({len(texts) / max(elapsed, 1e-6):,.1f} texts/s)")
+    
+    return [
+        (content, embedding, source_type, source_id, content_hash(content))
+        for (content, source_type, source_id), embedding in zip(documents, embeddings)
+    ]
 
 
 async def generate_embeddings():
     """Generate embeddings for all content"""
     async with async_session_maker() as session:
-        # Get all personal info
-        result = await session.execute(
-            text("SELECT id, category, content FROM personal_info")
-        )
-        personal_rows = result.fetchall()
+        documents = await build_documents(session)
         
-        # Get all projects
-        result = await session.execute(
-            text("SELECT id, name, description, tech_stack, highlights FROM projects")
-        )
-        project_rows = result.fetchall()
+        if not documents:
+            print("⚠ No content to embed")
+            return
         
-        # Prepare texts for embedding
-        texts = []
-        sources = []
+        print(f"⏳ Generating embeddings for {len(documents)} items...")
+        await copy_rows(session, "embeddings", EMBEDDING_COLUMNS, await embed_documents(documents))
+        await session.commit()
+        print(f"✓ Generated {len(documents)} embeddings")
+
+
+async def sync_embeddings() -> dict:
+    """
+    Re-embed only new or changed items and delete embeddings of removed ones
+    
+    Rows are matched on (source_type, source_id, content_hash). Rows imported
+    before content hashes existed are backfilled from their stored content.
+    New vectors are fetched before anything is written, so a failed embedding
+    call leaves the knowledge base as it was.
+    """
+    async with async_session_maker() as session:
+        documents = await build_documents(session)
         
-        for row in personal_rows:
-            texts.append(f"{row.category}: {row.content}")
-            sources.append(("personal_info", row.id))
+        result = await session.execute(
+            text("SELECT id, content, source_type, source_id, content_hash FROM embeddings")
+        )
+        existing = {}
+        stale_ids = []
+        backfill = []
+        for row in result.fetchall():
+            row_hash = row.content_hash
+            if row_hash is None:
+                row_hash = content_hash(row.content)
+                backfill.append({"hash": row_hash, "id": row.id})
+            key = (row.source_type, row.source_id, row_hash)
+            if key in existing:
+                stale_ids.append(row.id)  # Duplicate row
+            else:
+                existing[key] = row.id
         
-        for row in project_rows:
-            # Create rich text for project
-            tech_str = ", ".join(row.tech_stack) if row.tech_stack else ""
-            highlights_str = "; ".join(row.highlights) if row.highlights else ""
-            content = f"项目: {row.name}\n描述: {row.description}\n技术栈: {tech_str}\n亮点: {highlights_str}"
-            texts.append(content)
-            sources.append(("project", row.id))
+        new_documents = []
+        for content, source_type, source_id in documents:
+            key = (source_type, source_id, content_hash(content))
+            if existing.pop(key, None) is None:
+                new_documents.append((content, source_type, source_id))
+        stale_ids.extend(existing.values())
+        # Don't hold the read transaction open during embedding API calls
+        await session.rollback()
         
-        if not texts:
-            print("⚠ No content to embed")
-            return
+        records = []
+        if new_documents:
+            print(f"⏳ Generating embeddings for {len(new_documents)} new or changed items...")
+            records = await embed_documents(new_documents)
         
-        print(f"⏳ Generating embeddings for {len(texts)} items...")
-        
-        # Generate embeddings in batches
-        batch_size = 10
-        for i in range(0, len(texts), batch_size):
-            batch_texts = texts[i:i + batch_size]
-            batch_sources = sources[i:i + batch_size]
-            
-            embeddings = await embedding_service.embed_texts(batch_texts)
-            
-            for text_content, embedding, (source_type, source_id) in zip(batch_texts, embeddings, batch_sources):
-                embedding_str = "[" + ",".join(map(str, embedding)) + "]"
-                await session.execute(
-                    text("""
-                        INSERT INTO embeddings (content, embedding, source_type, source_id)
-                        VALUES (:content, CAST(:embedding AS vector), :source_type, :source_id)
-                    """),
-                    {
-                        "content": text_content,
-                        "embedding": embedding_str,
-                        "source_type": source_type,
-                        "source_id": source_id,
-                    }
-                )
-            
-            await session.commit()
-            print(f"  ✓ Batch {i // batch_size + 1}/{(len(texts) + batch_size - 1) // batch_size}")
-        
-        print(f"✓ Generated {len(texts)} embeddings")
+        # Backfill, removal and insertion land together
+        if backfill:
+            await session.execute(
+                text("UPDATE embeddings SET content_hash = :hash WHERE id = :id"), backfill
+            )
+        if stale_ids:
+            await session.execute(
+                text("DELETE FROM embeddings WHERE id = ANY(:ids)"), {"ids": stale_ids}
+            )
+        await copy_rows(session, "embeddings", EMBEDDING_COLUMNS, records)
+        await session.commit()
+    
+    stats = {"added": len(new_documents), "removed": len(stale_ids)}
+    print(f"✓ Embeddings synced: {stats['added']} added, {stats['removed']} removed, "
+          f"{len(documents) - stats['added']} unchanged")
+    return stats
 
 
 async def clear_cache():
-    """Clear Redis cache"""
-    from app.core.redis import get_redis
+    """Clear answer and retrieval caches (embeddings stay valid across imports)"""
+    from app.core.redis import get_redis, cache_generations, publish_knowledge_change
     redis_client = await get_redis()
-    await redis_client.flushdb()
-    print("✓ Cleared Redis cache")
+    # Workers drop their in-process indexes first, so nothing cached under
+    # the new generations comes from the old knowledge base
+    await publish_knowledge_change(redis_client)
+    await cache_generations.bump(redis_client, "answers", "docs", "rerank", "semantic")
+    print("✓ Cleared cached answers and retrieval results")
 
 
-async def main():
-    """Main import function"""
+async def main(full: bool = False):
+    """
+    Main import function
+    
+    Args:
+        full: Truncate and rebuild everything instead of syncing changes
+    """
     profile_path = Path(__file__).parent.parent / "data" / "personal_profile.json"
     
     if not profile_path.exists():
@@ -185,20 +377,44 @@ async def main():
         print(f"✓ Created sample profile at: {profile_path}")
     
     print("=" * 50)
-    print("Personal Profile Import Script")
+    print("Personal Profile Import Script" + (" (full rebuild)" if full else ""))
     print("=" * 50)
     
-    print("\n[1/4] Clearing existing data...")
-    await clear_existing_data()
-    
-    print("\n[2/4] Importing profile data...")
-    await import_profile(str(profile_path))
+    if full:
+        print("\n[1/4] Clearing existing data...")
+        await clear_existing_data()
+        
+        print("\n[2/4] Importing profile data...")
+        await import_profile(str(profile_path))
+        
+        print("\n[3/4] Generating embeddings...")
+        await generate_embeddings()
+        changed = True
+    else:
+        print("\n[1/3] Syncing profile data...")
+        await sync_profile(str(profile_path))
+        
+        print("\n[2/3] Syncing embeddings...")
+        stats = await sync_embeddings()
+        changed = bool(stats["added"] or stats["removed"])
     
-    print("\n[3/4] Generating embeddings...")
-    await generate_embeddings()
+    # Answers, retrieval results and reranks depend on the knowledge base;
+    # query embeddings do not, and nothing needs clearing if no embedding changed
+    if changed:
+        step = 4 if full else 3
+        print(f"\n[{step}/{step}] Clearing cache...")
+        await clear_cache()
+        
+        # Pre-answer suggested and popular questions against the new knowledge base
+        from app.tasks.cache_warmer import warm_cache
+        await warm_cache()
+    else:
+        print("\n✓ Knowledge base unchanged, caches kept")
     
-    print("\n[4/4] Clearing cache...")
-    await clear_cache()
+    # Write the buffered embedding usage before the process exits
+    from app.core.redis import metrics_buffer
+    await metrics_buffer.flush()
+    await http_clients.shutdown()
     
     print("\n" + "=" * 50)
     print("✓ Import completed successfully!")
@@ -206,4 +422,11 @@ async def main():
 
 
 if __name__ == "__main__":
-    asyncio.run(main())
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument(
+        "--full",
+        action="store_true",
+        help="truncate all profile tables and re-embed everything",
+    )
+    args = parser.parse_args()
+    asyncio.run(main(full=args.full))
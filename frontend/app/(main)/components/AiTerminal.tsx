@@ -56,25 +56,36 @@ export default function AiTerminal() {
             // Add placeholder assistant message
             setMessages(prev => [...prev, { role: 'assistant', content: '' }])
 
-            while (reader) {
+            // SSE events end with a blank line and may be split across reads
+            let buffer = ''
+            let finished = false
+
+            while (reader && !finished) {
                 const { done, value } = await reader.read()
                 if (done) break
 
-                const chunk = decoder.decode(value)
-                const lines = chunk.split('\n')
+                buffer += decoder.decode(value, { stream: true })
+                const events = buffer.split('\n\n')
+                buffer = events.pop() ?? ''
 
-                for (const line of lines) {
-                    if (line.startsWith('data: ')) {
+                for (const event of events) {
+                    for (const line of event.split('\n')) {
+                        if (!line.startsWith('data: ')) continue
                         const data = line.slice(6)
-                        if (data === '[DONE]') break
-                        assistantContent += data
-                        setMessages(prev => {
-                            const updated = [...prev]
-                            updated[updated.length - 1] = { role: 'assistant', content: assistantContent }
-                            return updated
-                        })
+                        if (data === '[DONE]') {
+                            finished = true
+                            break
+                        }
+                        assistantContent += JSON.parse(data).delta
                     }
+                    if (finished) break
                 }
+
+                setMessages(prev => {
+                    const updated = [...prev]
+                    updated[updated.length - 1] = { role: 'assistant', content: assistantContent }
+                    return updated
+                })
             }
         } catch (error) {
             console.error('Error:', error)
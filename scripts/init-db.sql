@@ -36,6 +36,8 @@ CREATE TABLE IF NOT EXISTS embeddings (
     embedding vector(1024) NOT NULL,
     source_type VARCHAR(50) NOT NULL,
     source_id INTEGER,
+    -- Incremental import diffing (see backend/migrations/003)
+    content_hash VARCHAR(64),
     created_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP
 );
 
@@ -51,12 +53,37 @@ ON personal_info(category);
 CREATE INDEX IF NOT EXISTS idx_embeddings_source 
 ON embeddings(source_type, source_id);
 
--- HNSW index for vector similarity search
--- Using cosine distance for semantic similarity
-CREATE INDEX IF NOT EXISTS embeddings_embedding_idx 
-ON embeddings 
-USING hnsw (embedding vector_cosine_ops)
-WITH (m = 16, ef_construction = 64);
+-- Content hash index for incremental imports
+CREATE INDEX IF NOT EXISTS idx_embeddings_content_hash
+ON embeddings(content_hash);
+
+-- HNSW index for vector similarity search, only the one VECTOR_STORAGE_MODE
+-- searches (passed in by docker-compose as app.vector_storage_mode):
+--   full    - cosine distance over the full-precision vectors
+--   halfvec - half-precision expression index (~50% of the full index)
+--   binary  - binary-quantized expression index (~3% of the full index)
+-- Switch modes later with backend/migrations/002_vector_storage_mode.sql
+DO $$
+DECLARE
+    mode TEXT := COALESCE(NULLIF(current_setting('app.vector_storage_mode', true), ''), 'full');
+BEGIN
+    IF mode = 'halfvec' THEN
+        CREATE INDEX IF NOT EXISTS embeddings_embedding_half_idx
+        ON embeddings
+        USING hnsw ((embedding::halfvec(1024)) halfvec_cosine_ops)
+        WITH (m = 16, ef_construction = 64);
+    ELSIF mode = 'binary' THEN
+        CREATE INDEX IF NOT EXISTS embeddings_embedding_bit_idx
+        ON embeddings
+        USING hnsw ((binary_quantize(embedding)::bit(1024)) bit_hamming_ops)
+        WITH (m = 16, ef_construction = 64);
+    ELSE
+        CREATE INDEX IF NOT EXISTS embeddings_embedding_idx
+        ON embeddings
+        USING hnsw (embedding vector_cosine_ops)
+        WITH (m = 16, ef_construction = 64);
+    END IF;
+END $$;
 
 -- ===========================================
 -- Update trigger for updated_at